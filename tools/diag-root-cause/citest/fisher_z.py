@@ -1,4 +1,8 @@
+import math
+from collections import OrderedDict
+
 import numpy as np
+from scipy.special import erfc
 from scipy.stats import norm
 
 
@@ -32,3 +36,124 @@ def pcor_order(x, y, s, cm):
     else:
         pim = np.linalg.pinv(cm[[x, y] + s, :][:, [x, y] + s])
         return -pim[0, 1] / np.sqrt(pim[0, 0] * pim[1, 1])
+
+
+# the residual variance of a variable below this ratio to its variance means
+# that the variable is (nearly) a linear combination of the conditioning set,
+# or of the set and the other variable where 1 - r^2 is below it, so that
+# the Schur complement is lost in rounding errors.
+RESIDUAL_RTOL = 1e-10
+
+# the number of the conditioning sets whose residuals are cached.
+RESIDUALS_CACHE_SIZE = 4096
+
+
+class FisherZ:
+    """
+    Fisher's z test on a fixed correlation matrix, which can be passed to
+    pcalg.estimate_skeleton as indep_test_func in place of ci_test_fisher_z.
+
+    The partial correlation of x and y given S is derived by the Schur complement
+        cov(x, y | S) = cm[x, y] - cm[x, S] pinv(cm[S, S]) cm[S, y],
+    where cm[:, S] pinv(cm[S, S]) and the residual variances of all the
+    variables are computed once per conditioning set S and cached, so that
+    the queries sharing S, including the ones of many (x, y) pairs at once by
+    p_values, cost a dot product each instead of a pseudo-inverse. The
+    residuals of the RESIDUALS_CACHE_SIZE conditioning sets used last are kept.
+    Where x or y is collinear with S, or x with y given S, the partial
+    correlation falls back to pcor_order like ci_test_fisher_z.
+
+    With memoize=True, the p-value of every (x, y, S) is also cached, so that
+    the PC runs sharing the instance over several significance levels test
+    each (x, y, S) once.
+    """
+
+    def __init__(self, corr_matrix, n, memoize=False):
+        self.cm = np.asarray(corr_matrix, dtype=np.float64)
+        self.n = n
+        self._residuals = OrderedDict()
+        self._p_values = {} if memoize else None
+
+    def __call__(self, data_matrix, x, y, s, **kwargs):
+        return self.p_value(x, y, s)
+
+    def p_value(self, x, y, s):
+        if self._p_values is None:
+            return math.erfc(abs(self.zstat(x, y, s)) / math.sqrt(2))
+        key = (x, y, frozenset(s)) if x < y else (y, x, frozenset(s))
+        if (p := self._p_values.get(key)) is None:
+            p = self._p_values[key] = math.erfc(abs(self.zstat(x, y, s)) / math.sqrt(2))
+        return p
+
+    def zstat(self, x, y, s):
+        r = self.pcor(x, y, s)
+        if r == 1:
+            r = 1 - 1e-10
+        try:
+            # log1p(-1) is -inf like np.log1p in ci_test_fisher_z.
+            q = -math.inf if r == -1 else math.log1p((2 * r) / (1 - r))
+            zv = math.sqrt(self.n - len(s) - 3) * 0.5 * q
+        except (ValueError, ZeroDivisionError):
+            zv = math.nan
+        if math.isnan(zv):
+            return 0
+        return zv
+
+    def _residual(self, s):
+        """ Return cm[:, S] pinv(cm[S, S]), cm[:, S] and the residual variances. """
+        key = tuple(sorted(s))
+        if (res := self._residuals.get(key)) is not None:
+            self._residuals.move_to_end(key)
+            return res
+        idx = list(key)
+        c = self.cm[:, idx]
+        w = c @ np.linalg.pinv(c[idx])
+        res = self._residuals[key] = (w, c, np.diag(self.cm) - np.einsum('ij,ij->i', w, c))
+        if len(self._residuals) > RESIDUALS_CACHE_SIZE:
+            self._residuals.popitem(last=False)
+        return res
+
+    def _pcor_order(self, x, y, s):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return float(pcor_order(x, y, list(s), self.cm))
+
+    def pcor(self, x, y, s):
+        """ Return the partial correlation of x and y given s. """
+        if len(s) == 0:
+            return float(self.cm[x, y])
+        w, c, var = self._residual(s)
+        var_x, var_y = float(var[x]), float(var[y])
+        if var_x > RESIDUAL_RTOL * self.cm[x, x] and var_y > RESIDUAL_RTOL * self.cm[y, y]:
+            r = (float(self.cm[x, y]) - float(w[x] @ c[y])) / math.sqrt(var_x * var_y)
+            if r * r <= 1 - RESIDUAL_RTOL:
+                return r
+        return self._pcor_order(x, y, s)
+
+    def pcors(self, xs, ys, s):
+        """ Return the partial correlations of the pairs (xs[i], ys[i]) given s. """
+        xs, ys = np.asarray(xs, dtype=np.intp), np.asarray(ys, dtype=np.intp)
+        if len(s) == 0:
+            return self.cm[xs, ys]
+        w, c, var = self._residual(s)
+        diag = np.diag(self.cm)
+        ok = (var[xs] > RESIDUAL_RTOL * diag[xs]) & (var[ys] > RESIDUAL_RTOL * diag[ys])
+        cov = self.cm[xs, ys] - np.einsum('ij,ij->i', w[xs], c[ys])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = cov / np.sqrt(np.where(ok, var[xs] * var[ys], 1.))
+        for i in np.flatnonzero(~(ok & (r * r <= 1 - RESIDUAL_RTOL))):
+            r[i] = self._pcor_order(xs[i], ys[i], s)
+        return r
+
+    def p_values(self, xs, ys, s):
+        """ Return the p-values of the pairs (xs[i], ys[i]) given s. """
+        r = self.pcors(xs, ys, s)
+        r = np.where(r == 1, 1 - 1e-10, r)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            zv = np.sqrt(self.n - len(s) - 3) * 0.5 * np.log1p((2 * r) / (1 - r))
+        zv = np.where(np.isnan(zv), 0, zv)
+        return erfc(np.absolute(zv) / np.sqrt(2))
+
+    def clear(self):
+        self._residuals.clear()
+        if self._p_values is not None:
+            self._p_values.clear()
@@ -1,7 +1,11 @@
+import math
+
 import numpy as np
 import pandas as pd
 from scipy import stats
 
+from citest.fisher_z import FisherZ
+
 
 def fisher_z(X, Y, Z, data, boolean=True, **kwargs):
     # Step 1: Test if the inputs are correct
@@ -53,3 +57,38 @@ def pcor_order(X, Y, Z, data):
         residual_Y = data.loc[:, Y] - data.loc[:, Z].dot(Y_coef)
         coef, _ = stats.pearsonr(residual_X, residual_Y)
     return coef
+
+
+class CorrFisherZ:
+    """
+    fisher_z on the correlation matrix of data computed once, which can be
+    passed to pgmpy.estimators.PC.estimate as ci_test for the same data.
+    The variables are mapped to their positions in the matrix, and the partial
+    correlations are derived from it by citest.fisher_z.FisherZ instead of
+    the regressions on the data of every test. memoize is passed to FisherZ.
+    The data given to every test, which can be a copy of data made by pgmpy,
+    must have the same shape and columns as data.
+    """
+
+    def __init__(self, data, memoize=False):
+        if not isinstance(data, pd.DataFrame):
+            raise ValueError(
+                f"Variable data. Expected type: pandas.DataFrame. Got type: {type(data)}"
+            )
+        self.data = data
+        self.columns = data.columns
+        self.index = {c: i for i, c in enumerate(data.columns)}
+        self.test = FisherZ(np.corrcoef(data.values.T), data.shape[0], memoize)
+
+    def __call__(self, X, Y, Z, data, boolean=True, **kwargs):
+        if not hasattr(Z, "__iter__"):
+            raise ValueError(f"Variable Z. Expected type: iterable. Got type: {type(Z)}")
+        if data is not self.data and (data.shape != self.data.shape or not data.columns.equals(self.columns)):
+            raise ValueError("Variable data. Expected the data of the correlation matrix")
+
+        x, y, s = self.index[X], self.index[Y], [self.index[z] for z in Z]
+        if boolean:
+            return self.test.p_value(x, y, s) >= kwargs["significance_level"]
+        else:
+            zs = self.test.zstat(x, y, s)
+            return zs, math.erfc(abs(zs) / math.sqrt(2))
@@ -63,22 +63,23 @@ def main():
     items = {}
     for tsdr_file in args.tsdr_files:
         for library in ['pcalg', 'pgmpy']:
-            for alpha in ALPHAS:
-                try:
-                    meta = diag.diag(tsdr_file, alpha, True, library, dir)
-                    chaosType = meta['metrics_meta']['injected_chaos_type']
-                    chaosComp = meta['metrics_meta']['chaos_injected_component']
-                    items.setdefault(chaosType, {})
-                    items[chaosType].setdefault(chaosComp, {
-                        'results': [],
-                    })
-                    items[chaosType][chaosComp]['results'].append({
-                        'meta': meta,
-                        'pc_stable': 1,
-                        'alpha': alpha,
-                    })
-                except ValueError as e:
-                    log(e)
+            try:
+                metas = diag.diag_alphas(tsdr_file, ALPHAS, True, library, dir)
+            except ValueError as e:
+                log(e)
+                continue
+            for alpha, meta in zip(ALPHAS, metas):
+                chaosType = meta['metrics_meta']['injected_chaos_type']
+                chaosComp = meta['metrics_meta']['chaos_injected_component']
+                items.setdefault(chaosType, {})
+                items[chaosType].setdefault(chaosComp, {
+                    'results': [],
+                })
+                items[chaosType][chaosComp]['results'].append({
+                    'meta': meta,
+                    'pc_stable': 1,
+                    'alpha': alpha,
+                })
 
     if args.out_markdown is not None:
         dst = template.render(items=items, ts=ts)
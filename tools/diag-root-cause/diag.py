@@ -18,8 +18,9 @@ import pcalg
 from IPython.display import Image
 from pgmpy import estimators
 
-from citest.fisher_z import ci_test_fisher_z
-from citest.fisher_z_pgmpy import fisher_z
+import skeleton
+from citest.fisher_z import FisherZ
+from citest.fisher_z_pgmpy import CorrFisherZ
 
 SIGNIFICANCE_LEVEL = 0.05
 
@@ -103,45 +104,36 @@ def read_data_file(tsdr_result_file):
         tsdr_result['metrics_meta']
 
 
+def count_no_paths(forbidden, sizes):
+    """ Return the number of the pairs of metrics of the forbidden pairs of components. """
+    return int(np.triu(forbidden[:-1, :-1] * np.outer(sizes, sizes)).sum())
+
+
 def build_no_paths(labels, mappings):
-    containers_list, services_list, nodes_list = [], [], []
-    for v in labels.values():
-        if re.match("^c-", v):
-            container_name = v.split("_")[0].replace("c-", "")
-            if container_name not in containers_list:
-                containers_list.append(container_name)
-        elif re.match("^s-", v):
-            service_name = v.split("_")[0].replace("s-", "")
-            if service_name not in services_list:
-                services_list.append(service_name)
-        elif re.match("^n-", v):
-            node_name = v.split("_")[0].replace("n-", "")
-            if node_name not in nodes_list:
-                nodes_list.append(node_name)
-
-    containers_metrics = {}
-    for c in containers_list:
-        nodes = []
-        for k, v in labels.items():
-            if re.match("^c-{}_".format(c), v):
-                nodes.append(k)
-        containers_metrics[c] = nodes
-
-    services_metrics = {}
-    for s in services_list:
-        nodes = []
-        for k, v in labels.items():
-            if re.match("^s-{}_".format(s), v):
-                nodes.append(k)
-        services_metrics[s] = nodes
-
-    nodes_metrics = {}
-    for n in nodes_list:
-        nodes = []
-        for k, v in labels.items():
-            if re.match("^n-{}_".format(n), v):
-                nodes.append(k)
-        nodes_metrics[n] = nodes
+    """
+    Return the symmetric boolean matrix, whose (i, j) element is True if the
+    metrics labels[i] and labels[j] cannot have a path in the causal graph.
+    The metrics are grouped by their components once, and the pairs of
+    components without dependence are expanded into the pairs of their metrics.
+    """
+    # (kind, component name) -> component id, -1 for the metrics of no component.
+    components = {}
+    component_ids = np.full(len(labels), -1)
+    for k, v in labels.items():
+        kind, _, name = v.split("_")[0].partition("-")
+        if kind in ("c", "s", "n"):
+            component_ids[k] = components.setdefault((kind, name), len(components))
+    containers_list = [name for kind, name in components if kind == "c"]
+    services_list = [name for kind, name in components if kind == "s"]
+    nodes_list = [name for kind, name in components if kind == "n"]
+    sizes = np.bincount(component_ids[component_ids >= 0], minlength=len(components))
+
+    # the last row and column are of the metrics of no component.
+    forbidden = np.zeros((len(components) + 1, len(components) + 1), dtype=bool)
+
+    def forbid(c1, c2):
+        forbidden[components[c1], components[c2]] = True
+        forbidden[components[c2], components[c1]] = True
 
     # Share host
     nodes_containers = {}
@@ -152,16 +144,13 @@ def build_no_paths(labels, mappings):
             nodes_containers[container] = node
 
     # C-C
-    no_paths = []
     no_deps_C_C_pair = []
     for i, j in combinations(containers_list, 2):
         if j not in CONTAINER_CALL_GRAPH[i] and nodes_containers[i] != nodes_containers[j]:
             no_deps_C_C_pair.append([i, j])
-    for pair in no_deps_C_C_pair:
-        for i in containers_metrics[pair[0]]:
-            for j in containers_metrics[pair[1]]:
-                no_paths.append([i, j])
-    print("No dependence C-C pairs: {}, No paths: {}".format(len(no_deps_C_C_pair), len(no_paths)))
+            forbid(("c", i), ("c", j))
+    print("No dependence C-C pairs: {}, No paths: {}".format(
+        len(no_deps_C_C_pair), count_no_paths(forbidden, sizes)))
 
     # S-S
     no_deps_S_S_pair = []
@@ -173,87 +162,88 @@ def build_no_paths(labels, mappings):
                     has_comm = True
         if not has_comm:
             no_deps_S_S_pair.append([i, j])
-    for pair in no_deps_S_S_pair:
-        for i in services_metrics[pair[0]]:
-            for j in services_metrics[pair[1]]:
-                no_paths.append([i, j])
-    print("No dependence S-S pairs: {}, No paths: {}".format(len(no_deps_S_S_pair), len(no_paths)))
+            forbid(("s", i), ("s", j))
+    print("No dependence S-S pairs: {}, No paths: {}".format(
+        len(no_deps_S_S_pair), count_no_paths(forbidden, sizes)))
 
     # N-N
     no_deps_N_N_pair = []
     for i, j in combinations(nodes_list, 2):
         no_deps_N_N_pair.append([i, j])
-        for n1 in nodes_metrics[i]:
-            for n2 in nodes_metrics[j]:
-                no_paths.append([n1, n2])
-    print("No dependence N-N pairs: {}, No paths: {}".format(len(no_deps_N_N_pair), len(no_paths)))
+        forbid(("n", i), ("n", j))
+    print("No dependence N-N pairs: {}, No paths: {}".format(
+        len(no_deps_N_N_pair), count_no_paths(forbidden, sizes)))
 
     # C-N
     for node in nodes_list:
         for con, host_node in nodes_containers.items():
-            if node != host_node:
-                for n1 in nodes_metrics[node]:
-                    if con not in containers_metrics:
-                        continue
-                    for c2 in containers_metrics[con]:
-                        no_paths.append([n1, c2])
-    print("[C-N] No paths: {}".format(len(no_paths)))
+            if node != host_node and con in containers_list:
+                forbid(("n", node), ("c", con))
+    print("[C-N] No paths: {}".format(count_no_paths(forbidden, sizes)))
 
     # S-N
     for service in SERVICE_CONTAINERS:
-        host_list = []
-        for con in SERVICE_CONTAINERS[service]:
-            if nodes_containers[con] not in host_list:
-                host_list.append(nodes_containers[con])
+        host_list = [nodes_containers[con] for con in SERVICE_CONTAINERS[service]]
         for node in nodes_list:
-            if node not in host_list:
-                if service not in services_metrics:
-                    continue
-                for s1 in services_metrics[service]:
-                    for n2 in nodes_metrics[node]:
-                        no_paths.append([s1, n2])
-    print("[S-N] No paths: {}".format(len(no_paths)))
+            if node not in host_list and service in services_list:
+                forbid(("s", service), ("n", node))
+    print("[S-N] No paths: {}".format(count_no_paths(forbidden, sizes)))
 
     # C-S
     for service in SERVICE_CONTAINERS:
-        for con in containers_metrics:
-            if con not in SERVICE_CONTAINERS[service]:
-                if service not in services_metrics:
-                    continue
-                for s1 in services_metrics[service]:
-                    for c2 in containers_metrics[con]:
-                        no_paths.append([s1, c2])
-    print("[C-S] No paths: {}".format(len(no_paths)))
-    return no_paths
+        for con in containers_list:
+            if con not in SERVICE_CONTAINERS[service] and service in services_list:
+                forbid(("s", service), ("c", con))
+    print("[C-S] No paths: {}".format(count_no_paths(forbidden, sizes)))
+
+    return forbidden[component_ids[:, np.newaxis], component_ids[np.newaxis, :]]
 
 
 def prepare_init_graph(reduced_df, no_paths):
+    """
+    Build the graph connecting all the pairs of metrics except the ones of
+    no_paths, the boolean matrix of build_no_paths.
+    """
     dm = reduced_df.values
     print("Shape of data matrix: {}".format(dm.shape))
     init_g = nx.Graph()
-    node_ids = range(len(reduced_df.columns))
-    init_g.add_nodes_from(node_ids)
-    for (i, j) in combinations(node_ids, 2):
-        init_g.add_edge(i, j)
-    print("Number of edges in complete graph : {}".format(init_g.number_of_edges()))
-    for no_path in no_paths:
-        init_g.remove_edge(no_path[0], no_path[1])
+    node_size = len(reduced_df.columns)
+    init_g.add_nodes_from(range(node_size))
+    print("Number of edges in complete graph : {}".format(node_size * (node_size - 1) // 2))
+    rows, cols = np.nonzero(np.triu(~no_paths, k=1))
+    init_g.add_edges_from(zip(rows.tolist(), cols.tolist()))
     print("Number of edges in init graph : {}".format(init_g.number_of_edges()))
     return init_g
 
 
-def build_causal_graph_with_pcalg(dm, labels, init_g, alpha, pc_stable):
+def build_causal_graph_with_pcalg(dm, labels, init_g, alpha, pc_stable,
+                                  pc_skeleton='pcalg', no_paths=None, max_workers=None,
+                                  indep_test=None):
     """
     Build causal graph with PC algorithm.
+    pc_skeleton selects the implementation of the skeleton estimation,
+    'pcalg' or 'native' (skeleton.estimate_skeleton).
+    indep_test is the FisherZ of dm, which is created if not given.
     """
-    cm = np.corrcoef(dm.T)
+    if indep_test is None:
+        indep_test = FisherZ(np.corrcoef(dm.T), dm.shape[0])
     pc_method = 'stable' if pc_stable else None
-    (G, sep_set) = pcalg.estimate_skeleton(indep_test_func=ci_test_fisher_z,
-                                           data_matrix=dm,
-                                           alpha=alpha,
-                                           corr_matrix=cm,
-                                           init_graph=init_g,
-                                           method=pc_method)
+    if pc_skeleton == 'native':
+        (G, sep_set) = skeleton.estimate_skeleton(indep_test_func=indep_test,
+                                                  data_matrix=dm,
+                                                  alpha=alpha,
+                                                  init_graph=init_g,
+                                                  forbidden=no_paths,
+                                                  method=pc_method,
+                                                  max_workers=max_workers)
+    elif pc_skeleton == 'pcalg':
+        (G, sep_set) = pcalg.estimate_skeleton(indep_test_func=indep_test,
+                                               data_matrix=dm,
+                                               alpha=alpha,
+                                               init_graph=init_g,
+                                               method=pc_method)
+    else:
+        raise ValueError('pc_skeleton should be pcalg or native')
     G = pcalg.estimate_cpdag(skel_graph=G, sep_set=sep_set)
 
     G = nx.relabel_nodes(G, labels)
@@ -263,12 +253,13 @@ def build_causal_graph_with_pcalg(dm, labels, init_g, alpha, pc_stable):
 
 def build_causal_graphs_with_pgmpy(df: pd.DataFrame,
                                    alpha: float,
-                                   pc_stable: bool) -> nx.Graph:
+                                   pc_stable: bool,
+                                   ci_test: Union[CorrFisherZ, None] = None) -> nx.Graph:
     c = estimators.PC(data=df)
     pc_method = 'stable' if pc_stable else None
     g = c.estimate(
         variant=pc_method,
-        ci_test=fisher_z,
+        ci_test=CorrFisherZ(df) if ci_test is None else ci_test,
         significance_level=alpha,
         return_type='pdag',
     )
@@ -307,7 +298,22 @@ def check_cause_metrics(ng: nx.Graph, chaos_type: str, chaos_comp: str) -> Tuple
     return False, cause_metrics
 
 
-def diag(tsdr_file, citest_alpha, pc_stable, library, out_dir):
+def diag(tsdr_file, citest_alpha, pc_stable, library, out_dir,
+         pc_skeleton='pcalg', max_workers=None):
+    return diag_alphas(tsdr_file, [citest_alpha], pc_stable, library, out_dir,
+                       pc_skeleton, max_workers)[0]
+
+
+def diag_alphas(tsdr_file, citest_alphas, pc_stable, library, out_dir,
+                pc_skeleton='pcalg', max_workers=None):
+    """
+    Run diag for every alpha of citest_alphas and return the list of the
+    results. The data file, the no paths and the CI test are shared by the
+    runs, and the CI test memoizes the p-value of every (x, y, S) if there are
+    two or more alphas, so that each (x, y, S) is tested once in the sweep.
+    The p-values are memoized in this process, so that the native skeleton
+    shares them only with max_workers=1.
+    """
     reduced_df, metrics_dimension, clustering_info, mappings, metrics_meta = \
         read_data_file(tsdr_file)
     if ROOT_METRIC_NODE not in reduced_df.columns:
@@ -320,19 +326,40 @@ def diag(tsdr_file, citest_alpha, pc_stable, library, out_dir):
     print("--> Building no paths", file=sys.stderr)
     no_paths = build_no_paths(labels, mappings)
 
-    print("--> Preparing initial graph", file=sys.stderr)
-    init_g = prepare_init_graph(reduced_df, no_paths)
-
-    print("--> Building causal graph", file=sys.stderr)
+    memoize = len(citest_alphas) > 1
     if library == 'pcalg':
-        g = build_causal_graph_with_pcalg(
-            reduced_df.values, labels, init_g, citest_alpha, pc_stable)
+        dm = reduced_df.values
+        indep_test = FisherZ(np.corrcoef(dm.T), dm.shape[0], memoize)
     elif library == 'pgmpy':
-        g = build_causal_graphs_with_pgmpy(
-            reduced_df, citest_alpha, pc_stable)
+        ci_test = CorrFisherZ(reduced_df, memoize)
     else:
         raise ValueError('library should be pcalg or pgmpy')
-    
+
+    results = []
+    for citest_alpha in citest_alphas:
+        # the initial graph is built for every alpha, since pcalg removes its edges.
+        print("--> Preparing initial graph", file=sys.stderr)
+        init_g = prepare_init_graph(reduced_df, no_paths)
+
+        print(f"--> Building causal graph with alpha {citest_alpha}", file=sys.stderr)
+        if library == 'pcalg':
+            g = build_causal_graph_with_pcalg(
+                dm, labels, init_g, citest_alpha, pc_stable,
+                pc_skeleton, no_paths, max_workers, indep_test)
+        else:
+            g = build_causal_graphs_with_pgmpy(
+                reduced_df, citest_alpha, pc_stable, ci_test)
+
+        # the files of the runs in a sweep are distinguished by alpha.
+        name = None if len(citest_alphas) == 1 else str(citest_alpha)
+        results.append(save_causal_graph(
+            g, tsdr_file, citest_alpha, pc_stable, out_dir, name,
+            metrics_dimension, clustering_info, metrics_meta))
+    return results
+
+
+def save_causal_graph(g, tsdr_file, citest_alpha, pc_stable, out_dir, name,
+                      metrics_dimension, clustering_info, metrics_meta):
     print("--> Checking causal graph including chaos-injected metrics", file=sys.stderr)
     chaos_type = metrics_meta['injected_chaos_type']
     chaos_comp = metrics_meta['chaos_injected_component']
@@ -352,6 +379,8 @@ def diag(tsdr_file, citest_alpha, pc_stable, library, out_dir):
         if not os.path.isdir(out_dir):
             os.makedirs(out_dir)
         ts = datetime.now().strftime("%Y%m%d%H%M%S")
+        if name is not None:
+            ts = f"{ts}-{name}"
         imgfile = os.path.join(out_dir, ts) + '.png'
         plt.savefig(imgfile)
         print(f"Saved the file of causal graph image to {imgfile}", file=sys.stderr)
@@ -383,21 +412,32 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("tsdr_resultfile", help="results file of tsdr")
     parser.add_argument("--citest-alpha",
-                        default=SIGNIFICANCE_LEVEL,
+                        default=[SIGNIFICANCE_LEVEL],
                         type=float,
-                        help="alpha value of independence test for building causality graph")
+                        nargs='+',
+                        help="alpha values of independence test for building causality graph, "
+                             "the CI tests are shared by the alphas")
     parser.add_argument("--pc-stable",
                         action='store_true',
                         help='whether to use stable method of PC-algorithm')
     parser.add_argument("--library",
                         default='pcalg',
                         help='pcalg or pgmpy')
+    parser.add_argument("--pc-skeleton",
+                        default='pcalg',
+                        choices=['pcalg', 'native'],
+                        help='implementation of the skeleton estimation of the pcalg library')
+    parser.add_argument("--max-workers",
+                        type=int,
+                        default=None,
+                        help='number of processes for the CI tests of the native stable PC skeleton')
     parser.add_argument("--out-dir",
                         help='output directory for saving graph image and metadata from tsdr')
     args = parser.parse_args()
 
-    diag(args.tsdr_resultfile, args.citest_alpha,
-         args.pc_stable, args.library, args.out_dir)
+    diag_alphas(args.tsdr_resultfile, args.citest_alpha,
+                args.pc_stable, args.library, args.out_dir,
+                args.pc_skeleton, args.max_workers)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+""" Check that FisherZ decides like ci_test_fisher_z on collinear data """
+
+import os
+import sys
+import warnings
+from itertools import combinations
+
+import numpy as np
+
+CUR_DIR = os.fspath(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(CUR_DIR, '..'))
+
+from citest import fisher_z  # noqa: E402
+from citest.fisher_z import FisherZ, ci_test_fisher_z  # noqa: E402
+
+ALPHA = 0.05
+
+
+def collinear_data(rng, n=200):
+    x = rng.normal(size=(n, 5))
+    x[:, 1] += 0.8 * x[:, 0]
+    x[:, 3] += 0.5 * x[:, 2]
+    # a duplicated column and a linear combination of two columns.
+    return np.column_stack([x, x[:, 0], 2 * x[:, 1] - x[:, 2]])
+
+
+def ci_tests(node_size, max_depth=2):
+    for x, y in combinations(range(node_size), 2):
+        others = [k for k in range(node_size) if k not in (x, y)]
+        for depth in range(max_depth + 1):
+            for s in combinations(others, depth):
+                yield x, y, set(s)
+
+
+def test_decisions_equal_baseline_on_collinear_data():
+    dm = collinear_data(np.random.default_rng(0))
+    cm = np.corrcoef(dm.T)
+    indep_test = FisherZ(cm, dm.shape[0])
+    for x, y, s in ci_tests(dm.shape[1]):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            p = indep_test(dm, x, y, s)
+        with np.errstate(all='ignore'):
+            expected = ci_test_fisher_z(dm, x, y, s, corr_matrix=cm)
+        assert (p > ALPHA) == (expected > ALPHA), (x, y, s, p, expected)
+
+
+def test_batch_decisions_equal_baseline_on_collinear_data():
+    dm = collinear_data(np.random.default_rng(1))
+    cm = np.corrcoef(dm.T)
+    indep_test = FisherZ(cm, dm.shape[0])
+    node_size = dm.shape[1]
+    for s in [(0,), (5,), (1, 2), (0, 6), (1, 2, 6)]:
+        pairs = [(x, y) for x, y in combinations(range(node_size), 2) if x not in s and y not in s]
+        xs, ys = zip(*pairs)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            ps = indep_test.p_values(xs, ys, set(s))
+        for (x, y), p in zip(pairs, ps):
+            with np.errstate(all='ignore'):
+                expected = ci_test_fisher_z(dm, x, y, set(s), corr_matrix=cm)
+            assert (p > ALPHA) == (expected > ALPHA), (x, y, s, p, expected)
+
+
+def test_residuals_cache_is_bounded():
+    dm = collinear_data(np.random.default_rng(2))
+    indep_test = FisherZ(np.corrcoef(dm.T), dm.shape[0])
+    size = fisher_z.RESIDUALS_CACHE_SIZE
+    fisher_z.RESIDUALS_CACHE_SIZE = 3
+    try:
+        for x, y, s in ci_tests(dm.shape[1]):
+            indep_test.p_value(x, y, s)
+        assert len(indep_test._residuals) == 3
+    finally:
+        fisher_z.RESIDUALS_CACHE_SIZE = size
+
+
+if __name__ == '__main__':
+    test_decisions_equal_baseline_on_collinear_data()
+    test_batch_decisions_equal_baseline_on_collinear_data()
+    test_residuals_cache_is_bounded()
+    print("ok")
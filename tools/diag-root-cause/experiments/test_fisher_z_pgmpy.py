@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+""" Check that CorrFisherZ decides like fisher_z on a copy of its data """
+
+import os
+import sys
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+CUR_DIR = os.fspath(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(CUR_DIR, '..'))
+
+from citest.fisher_z_pgmpy import CorrFisherZ, fisher_z  # noqa: E402
+
+ALPHA = 0.05
+
+
+def random_data(rng, n=200):
+    x = rng.normal(size=(n, 5))
+    x[:, 1] += 0.8 * x[:, 0]
+    x[:, 3] += 0.5 * x[:, 2] + 0.5 * x[:, 1]
+    return pd.DataFrame(x, columns=['a', 'b', 'c', 'd', 'e'])
+
+
+def test_decisions_on_copied_data():
+    data = random_data(np.random.default_rng(0))
+    ci_test = CorrFisherZ(data)
+    # pgmpy may pass a copy of the data to the test.
+    copied = data.copy()
+    for x, y in combinations(data.columns, 2):
+        others = [c for c in data.columns if c not in (x, y)]
+        for depth in range(3):
+            for z in combinations(others, depth):
+                assert ci_test(x, y, z, copied, significance_level=ALPHA) == \
+                    fisher_z(x, y, z, data, significance_level=ALPHA), (x, y, z)
+
+
+def test_other_data_is_rejected():
+    data = random_data(np.random.default_rng(1))
+    ci_test = CorrFisherZ(data)
+    for other in (data.iloc[:-1], data.drop(columns='e'), data.rename(columns={'e': 'f'})):
+        try:
+            ci_test('a', 'b', [], other, significance_level=ALPHA)
+        except ValueError:
+            continue
+        raise AssertionError("data of a different shape or columns is accepted")
+
+
+if __name__ == '__main__':
+    test_decisions_on_copied_data()
+    test_other_data_is_rejected()
+    print("ok")
@@ -0,0 +1,198 @@
+""" Skeleton estimation of the PC algorithm
+
+    A replacement of pcalg.estimate_skeleton, which keeps the adjacency of
+    every node as an integer bitset and runs the CI tests of each depth of
+    stable PC in worker processes. The result, including the separating sets,
+    is the same as the one of pcalg.estimate_skeleton given the same arguments,
+    as long as the neighbors of every node in init_graph are ordered by node id
+    like in the graphs built by diag.prepare_init_graph.
+"""
+
+import os
+from concurrent import futures
+from itertools import combinations, permutations
+
+import networkx as nx
+import numpy as np
+
+# the number of chunks of pairs per worker at each depth for load balancing.
+CHUNKS_PER_WORKER = 8
+
+# the ids of the bits set in every byte.
+_BYTE_MEMBERS = [tuple(b for b in range(8) if v >> b & 1) for v in range(256)]
+
+# the CI test function, the data matrix, the significance level and the
+# keyword arguments of the test in the worker processes.
+_test = None
+
+
+def _init_worker(indep_test_func, data_matrix, alpha, kwargs):
+    global _test
+    _test = (indep_test_func, data_matrix, alpha, kwargs)
+
+
+def members(bits):
+    """ Return the ids of the nodes in the bitset in ascending order. """
+    ids = []
+    for k, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, 'little')):
+        if byte:
+            ids.extend(8 * k + b for b in _BYTE_MEMBERS[byte])
+    return ids
+
+
+def count(bits):
+    return bin(bits).count('1')
+
+
+def find_sep_set(x, y, adj, depth):
+    """
+    Test the independence of x and y given every subset of size depth of the
+    neighbors of x except y, and return the first separating set found, or
+    None. The second value is whether x has depth neighbors except y.
+    """
+    indep_test_func, data_matrix, alpha, kwargs = _test
+    nbrs = adj[x] & ~(1 << y)
+    if count(nbrs) < depth:
+        return None, False
+    for k in combinations(members(nbrs), depth) if depth > 0 else [()]:
+        if indep_test_func(data_matrix, x, y, set(k), **kwargs) > alpha:
+            return k, True
+    return None, True
+
+
+def test_pairs(pairs, adj, depth):
+    """
+    Test the both sides of the adjacent pairs (i, j) against the adjacency
+    frozen at the beginning of the depth, and return the separating sets
+    found from the side of i and the one of j and whether any side was tested.
+    """
+    results, tested = [], False
+    for i, j in pairs:
+        sep_i, tested_i = find_sep_set(i, j, adj, depth)
+        sep_j, tested_j = find_sep_set(j, i, adj, depth)
+        results.append((sep_i, sep_j))
+        tested = tested or tested_i or tested_j
+    return results, tested
+
+
+def initial_adjacency(node_size, init_graph, forbidden):
+    if init_graph is None:
+        init_graph = nx.complete_graph(node_size)
+    elif init_graph.number_of_nodes() != node_size:
+        raise ValueError('init_graph not matching data_matrix shape')
+    adj = [0] * node_size
+    for i, j in init_graph.edges():
+        if i != j:
+            adj[i] |= 1 << j
+            adj[j] |= 1 << i
+    if forbidden is not None:
+        for i, row in enumerate(np.packbits(forbidden, axis=1, bitorder='little')):
+            adj[i] &= ~int.from_bytes(row.tobytes(), 'little')
+    return adj
+
+
+def initial_sep_set(adj):
+    node_size = len(adj)
+    return [[None if i != j and not adj[i] >> j & 1 else set() for j in range(node_size)]
+            for i in range(node_size)]
+
+
+def skeleton_stable(adj, max_reach, max_workers):
+    node_size = len(adj)
+    sep_set = initial_sep_set(adj)
+    executor = None
+    if max_workers != 1:
+        executor = futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=_test)
+    try:
+        depth = 0
+        while True:
+            pairs = [(i, j) for i in range(node_size) for j in members(adj[i] >> (i + 1) << (i + 1))]
+            if executor is None:
+                results, cont = test_pairs(pairs, adj, depth)
+            else:
+                n_chunks = min(len(pairs), (max_workers or os.cpu_count()) * CHUNKS_PER_WORKER)
+                chunks = [pairs[c::n_chunks] for c in range(n_chunks)]
+                fs = [executor.submit(test_pairs, chunk, adj, depth) for chunk in chunks]
+                results, cont = [None] * len(pairs), False
+                for c, f in enumerate(fs):
+                    res, tested = f.result()
+                    results[c::n_chunks] = res
+                    cont = cont or tested
+
+            for (i, j), (sep_i, sep_j) in zip(pairs, results):
+                if sep_i is None and sep_j is None:
+                    continue
+                adj[i] &= ~(1 << j)
+                adj[j] &= ~(1 << i)
+                for k in (sep_i, sep_j):
+                    if k is not None:
+                        sep_set[i][j] |= set(k)
+                        sep_set[j][i] |= set(k)
+
+            depth += 1
+            if not cont:
+                break
+            if max_reach is not None and depth > max_reach:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return sep_set
+
+
+def skeleton_original(adj, max_reach):
+    """ The order-dependent PC, which removes an edge as soon as it is separated. """
+    node_size = len(adj)
+    sep_set = initial_sep_set(adj)
+    depth = 0
+    while True:
+        cont = False
+        for i, j in permutations(range(node_size), 2):
+            if not adj[i] >> j & 1:
+                continue
+            k, tested = find_sep_set(i, j, adj, depth)
+            cont = cont or tested
+            if k is not None:
+                adj[i] &= ~(1 << j)
+                adj[j] &= ~(1 << i)
+                sep_set[i][j] |= set(k)
+                sep_set[j][i] |= set(k)
+        depth += 1
+        if not cont:
+            break
+        if max_reach is not None and depth > max_reach:
+            break
+    return sep_set
+
+
+def estimate_skeleton(indep_test_func, data_matrix, alpha, init_graph=None,
+                      forbidden=None, method=None, max_reach=None,
+                      max_workers=None, **kwargs):
+    """
+    Estimate a skeleton graph like pcalg.estimate_skeleton.
+
+    indep_test_func is called as indep_test_func(data_matrix, i, j, s, **kwargs)
+    and returns the p-value. forbidden is the symmetric boolean matrix of the
+    pairs of nodes excluded from init_graph, like the one of
+    diag.build_no_paths. The CI tests of
+    each depth run on max_workers processes if method is 'stable', where
+    max_workers=1 runs them in this process. Return the skeleton graph and
+    the separating sets, which are None for the pairs not adjacent initially.
+    """
+    global _test
+    node_size = data_matrix.shape[1]
+    adj = initial_adjacency(node_size, init_graph, forbidden)
+    _test = (indep_test_func, data_matrix, alpha, kwargs)
+    try:
+        if method == 'stable':
+            sep_set = skeleton_stable(adj, max_reach, max_workers)
+        else:
+            sep_set = skeleton_original(adj, max_reach)
+    finally:
+        _test = None
+
+    g = nx.Graph()
+    g.add_nodes_from(range(node_size))
+    g.add_edges_from((i, j) for i in range(node_size) for j in members(adj[i] >> (i + 1) << (i + 1)))
+    return g, sep_set
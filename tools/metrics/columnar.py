@@ -0,0 +1,155 @@
+""" Columnar layout of metrics data
+
+    +----------------------------------------------+
+    | MAGIC (8 bytes)                              |
+    | header length (uint64, little endian)        |
+    | header (JSON, padded by spaces to 8 bytes)   |
+    | timestamps (int64 x num_points)              |
+    | values (float64 x num_series x num_points)   |
+    +----------------------------------------------+
+
+    The header is a JSON object like:
+    {
+      'version': 1,
+      'meta': { ... },
+      'mappings': { ... },
+      'num_points': <number of timestamps>,
+      'series': [
+        { 'kind': 'containers', 'container_name': 'xx', 'metric_name': 'xx' },
+        { 'kind': 'services', 'service_name': 'xx', 'metric_name': 'xx' },
+        ...
+      ]
+    }
+
+    The values of the i-th series are stored contiguously in the i-th row
+    of the value matrix, so that the readers can memory-map the file and
+    slice the series without parsing them.
+
+    The values are kept only as float64, not as the strings returned by
+    Prometheus, so that the JSON view given by load() is canonicalized:
+    '14.9720' reads back as '14.972'. Compare the values of a capture and
+    of its columnar copy numerically, not as strings.
+"""
+
+import json
+import operator
+import struct
+
+import numpy as np
+
+MAGIC = b'TSDRCOL1'
+VERSION = 1
+KINDS = ('containers', 'middlewares', 'services', 'nodes')
+_HEADER_LEN = struct.Struct('<Q')
+
+
+def grid_index(values, start, end, step):
+    """
+    Return the indices of the [<timestamp>, '<value>'] pairs on the step
+    grid from start to end, where -1 means out of the grid.
+    """
+    timestamps = np.fromiter(map(operator.itemgetter(0), values), dtype=np.float64, count=len(values))
+    idx = np.rint((timestamps - start) / step).astype(np.int64)
+    idx[(idx < 0) | (idx > (end - start) // step)] = -1
+    return idx
+
+
+def place_time_series(row, values, start, end, step):
+    """
+    Write the values of the [<timestamp>, '<value>'] pairs into the float64
+    row of the step grid from start to end in place, skipping the pairs out
+    of the grid.
+    """
+    if len(values) < 1:
+        return row
+    idx = grid_index(values, start, end, step)
+    ok = idx >= 0
+    row[idx[ok]] = np.fromiter(map(float, map(operator.itemgetter(1), values)),
+                               dtype=np.float64, count=len(values))[ok]
+    return row
+
+
+def align_time_series(values, start, end, step):
+    """
+    Map the [<timestamp>, '<value>'] pairs onto the step grid from start to
+    end and return the dense float64 array, where lacking points are NaN.
+    """
+    return place_time_series(np.full((end - start) // step + 1, np.nan), values, start, end, step)
+
+
+def as_pairs(timestamps, row):
+    """ Return the float64 row as [<timestamp>, '<value>'] pairs. """
+    return [[ts, repr(v)] for ts, v in zip(timestamps, row.tolist())]
+
+
+def dump(data, f, default=None):
+    """
+    Write the result of metrics_as_result into the binary file object f.
+    Every series is aligned to the timestamps from meta['start'] to
+    meta['end'] by meta['step'], and lacking points are stored as NaN.
+    The values of a series are either [<timestamp>, '<value>'] pairs or
+    a float64 array already aligned, which is written as is.
+    """
+    meta = data['meta']
+    start, end, step = meta['start'], meta['end'], meta['step']
+    num_points = (end - start) // step + 1
+
+    series, rows = [], []
+    for kind in KINDS:
+        for metrics in data[kind].values():
+            for metric in metrics:
+                label = {k: v for k, v in metric.items() if k != 'values'}
+                label['kind'] = kind
+                series.append(label)
+                values = metric['values']
+                if not isinstance(values, np.ndarray):
+                    values = align_time_series(values, start, end, step)
+                rows.append(values)
+
+    header = json.dumps({
+        'version': VERSION,
+        'meta': meta,
+        'mappings': data['mappings'],
+        'num_points': num_points,
+        'series': series,
+    }, default=default).encode()
+    # align the following arrays to 8 bytes for memory-mapping.
+    header += b' ' * (-(len(MAGIC) + _HEADER_LEN.size + len(header)) % 8)
+
+    f.write(MAGIC)
+    f.write(_HEADER_LEN.pack(len(header)))
+    f.write(header)
+    f.write(np.arange(start, start + step * num_points, step, dtype='<i8').tobytes())
+    for row in rows:
+        f.write(row.astype('<f8', copy=False).tobytes())
+
+
+def load(path):
+    """
+    Read a columnar metrics file back into the layout of metrics_as_result,
+    where the values are [<timestamp>, '<value>'] pairs. Each value is the
+    repr of the stored float64, which parses back to the same float but
+    may differ from the original string, and lacking points are 'nan'.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a columnar metrics file".format(path))
+        header_len, = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+        header = json.loads(f.read(header_len))
+        num_points, num_series = header['num_points'], len(header['series'])
+        timestamps = np.fromfile(f, dtype='<i8', count=num_points).tolist()
+        values = np.fromfile(f, dtype='<f8', count=num_series * num_points).reshape(num_series, num_points)
+
+    data = {'meta': header['meta'], 'mappings': header['mappings']}
+    data.update({kind: {} for kind in KINDS})
+    for label, row in zip(header['series'], values):
+        kind = label.pop('kind')
+        name = label['{}_name'.format(kind[:-1]) if kind != 'middlewares' else 'container_name']
+        label['values'] = as_pairs(timestamps, row)
+        data[kind].setdefault(name, []).append(label)
+    return data
+
+
+def is_columnar(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
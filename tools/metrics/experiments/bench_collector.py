@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+CUR_DIR = os.fspath(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(CUR_DIR)
+
+import fake_prometheus  # noqa: E402
+
+COLLECTOR = os.path.join(CUR_DIR, '..', 'get_metrics_from_prom.py')
+START = 1600000000
+SCENARIOS = {
+    'default': [],
+    'batch': ['--batch-size', '50'],
+    'batch_with_recording_rules': ['--batch-size', '50', '--use-recording-rules'],
+    'columnar': ['--format', 'columnar'],
+}
+
+
+# run the collector script given after the path of the file, into which its
+# peak RSS in KiB is written at exit. VmHWM counts the pages of the address
+# space created at exec only, unlike ru_maxrss of the child, which includes
+# the RSS of this process, where the fake server runs, inherited at fork.
+PEAK_RSS_WRAPPER = """
+import atexit, os, runpy, sys
+
+def report(path):
+    with open('/proc/self/status') as f:
+        peak = next(line.split()[1] for line in f if line.startswith('VmHWM:'))
+    with open(path, 'w') as f:
+        f.write(peak)
+
+atexit.register(report, sys.argv[1])
+sys.argv = sys.argv[2:]
+sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+
+def log(msg):
+    print(msg, file=sys.stderr)
+
+
+def run_collector(url, args, out):
+    """
+    Run the collector in a child process and return the elapsed seconds
+    and the peak RSS in KiB of the collector.
+    """
+    args = [COLLECTOR, '--prometheus-url', url, '--out', out] + args
+    # stderr goes to a file, since a pipe left unread until the child exits
+    # blocks the child once it writes more than the pipe buffer.
+    with tempfile.TemporaryFile() as stderr, tempfile.NamedTemporaryFile('r') as peak_rss:
+        start = time.time()
+        proc = subprocess.run([sys.executable, '-c', PEAK_RSS_WRAPPER, peak_rss.name] + args,
+                              stdout=subprocess.DEVNULL, stderr=stderr)
+        elapsed = time.time() - start
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError("collector failed: {}\n{}".format(' '.join(args), stderr.read().decode()))
+        return elapsed, int(peak_rss.read())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", help="capture of get_metrics_from_prom.py to serve", type=str)
+    parser.add_argument("--metrics-num", help="number of synthetic metrics per group", type=int, default=100)
+    parser.add_argument("--series-num", help="number of synthetic series per metric", type=int, default=14)
+    parser.add_argument("--gap-rate", help="rate of lacking points of synthetic series", type=float, default=0.0)
+    parser.add_argument("--latency", help="seconds to delay each request", type=float, default=0.01)
+    parser.add_argument("--duration", help="duration of the capture", type=str, default="30m")
+    parser.add_argument("--scenarios", help="scenarios to run", nargs='+',
+                        choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--num-test", help="number of test", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.dataset is not None:
+        dataset = fake_prometheus.RecordedDataset(args.dataset)
+        start = dataset.meta['start']
+    else:
+        dataset = fake_prometheus.SyntheticDataset(args.metrics_num, args.series_num, args.gap_rate)
+        start = START
+    server = fake_prometheus.FakePrometheus(('127.0.0.1', 0), dataset, args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    common_args = ['--start', str(start), '--duration', args.duration, '--targets-cache-ttl', '0']
+    output = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name in args.scenarios:
+            log(f"Running the collector in scenario {name} ...")
+            out = os.path.join(tmpdir, name)
+            results = []
+            for _ in range(args.num_test):
+                server.reset_stats()
+                elapsed, maxrss = run_collector(server.url, common_args + SCENARIOS[name], out)
+                results.append((elapsed, maxrss, server.stats['requests'], len(server.stats['connections'])))
+            elapsed, maxrss, requests, connections = min(results)
+            output[name] = {
+                'time': round(elapsed, 3),
+                'peak_rss_kib': maxrss,
+                'requests': requests,
+                'connections': connections,
+                'output_size': os.path.getsize(out),
+            }
+    server.shutdown()
+
+    json.dump(output, sys.stdout, indent=4)
+
+
+if __name__ == '__main__':
+    main()
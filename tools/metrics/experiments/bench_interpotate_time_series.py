@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+CUR_DIR = os.fspath(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(CUR_DIR, '..'))
+
+import columnar  # noqa: E402
+
+STEP = 15
+POINT_NUM = 361
+SERIES_NUM = 10000
+NAN = 'nan'
+
+
+def log(msg):
+    print(msg, file=sys.stderr)
+
+
+def legacy_interpotate_time_series(values, time_meta):
+    """ The former implementation of interpotate_time_series for comparison. """
+    start, end, step = time_meta['start'], time_meta['end'], time_meta['step']
+    new_values = []
+
+    # start check
+    if (lost_num := int((values[0][0] - start) / step)-1) > 0:
+        for j in range(lost_num):
+            new_values.append([start + step*j, NAN])
+
+    for i, val in enumerate(values):
+        if i+1 >= len(values):
+            new_values.append(val)
+            break
+        cur_ts, next_ts = val[0], values[i+1][0]
+        new_values.append(val)
+        if (lost_num := int((next_ts - cur_ts) / step)-1) > 0:
+            for j in range(lost_num):
+                new_values.append([cur_ts + step*(j+1), NAN])
+
+    # end check
+    last_ts = values[-1][0]
+    if (lost_num := int((end - last_ts) / step)) > 0:
+        for j in range(lost_num):
+            new_values.append([last_ts + step*(j+1), NAN])
+
+    return new_values
+
+
+def generate_series(series_num, time_meta, gap_rate, seed=0):
+    """
+    Generate series lacking random points except the first one, which the
+    former implementation cannot fill before.
+    """
+    rnd = random.Random(seed)
+    start, end, step = time_meta['start'], time_meta['end'], time_meta['step']
+    series = []
+    for _ in range(series_num):
+        values = [[start, str(rnd.random())]]
+        values += [[ts, str(rnd.random())] for ts in range(start + step, end + 1, step)
+                   if rnd.random() >= gap_rate]
+        series.append(values)
+    return series
+
+
+def measure(func, series, time_meta, num_test):
+    elapsed = []
+    for _ in range(num_test):
+        start = time.time()
+        results = [func(values, time_meta) for values in series]
+        elapsed.append(time.time() - start)
+    return min(elapsed), results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series-num", help="number of series", type=int, default=SERIES_NUM)
+    parser.add_argument("--point-num", help="number of points per series", type=int, default=POINT_NUM)
+    parser.add_argument("--gap-rates", help="rates of lacking points",
+                        type=float, nargs='+', default=[0.0, 0.1, 0.5])
+    parser.add_argument("--num-test", help="number of test", type=int, default=3)
+    args = parser.parse_args()
+
+    start = 1600000000
+    time_meta = {'start': start, 'end': start + STEP * (args.point_num - 1), 'step': STEP}
+    output = {}
+    for gap_rate in args.gap_rates:
+        series = generate_series(args.series_num, time_meta, gap_rate)
+
+        log(f"Running interpotate_time_series in case of gap rate {gap_rate} ...")
+        old_time, old_results = measure(legacy_interpotate_time_series, series, time_meta, args.num_test)
+        align_time, align_results = measure(
+            lambda values, tm: columnar.align_time_series(values, tm['start'], tm['end'], tm['step']),
+            series, time_meta, args.num_test)
+        for old, aligned in zip(old_results, align_results):
+            assert np.array_equal(np.array([v for _, v in old], dtype=np.float64), aligned, equal_nan=True)
+        output[gap_rate] = {
+            'legacy_interpotate_time_series': round(old_time, 3),
+            'align_time_series': round(align_time, 3),
+        }
+
+    json.dump(output, sys.stdout, indent=4)
+
+
+if __name__ == '__main__':
+    main()
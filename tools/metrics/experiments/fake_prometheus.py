@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+""" A stand-in for the Prometheus API used by get_metrics_from_prom.py
+
+    It serves /api/v1/targets/metadata and /api/v1/query_range from either
+    a synthetic dataset or a capture recorded by get_metrics_from_prom.py,
+    with a configurable latency per request. The number of requests served
+    is available at /-/stats and reset by /-/reset.
+"""
+
+import argparse
+import gzip
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CUR_DIR = os.fspath(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(CUR_DIR, '..'))
+
+import get_metrics_from_prom  # noqa: E402
+
+NODES = ['gke-sock-shop-{}-node-{}'.format(get_metrics_from_prom.APP_NODEPOOL, i) for i in range(3)]
+MIDDLEWARES = ['carts-db', 'orders-db', 'user-db', 'catalogue-db']
+
+
+def query_group(query):
+    """ Return the target group of a query or a selector of targets. """
+    if 'kubernetes-service-endpoints' in query:
+        return 'services'
+    if 'node-exporter' in query:
+        return 'nodes'
+    if 'app="{}"'.format(get_metrics_from_prom.APP_LABEL) in query:
+        return 'pods'
+    return 'containers'
+
+
+def query_metric_names(query):
+    if (m := re.search(r'__name__=~"([^"]+)"', query)) is not None:
+        return m.group(1).split('|')
+    if (m := re.search(r'([A-Za-z_:][\w:]*)\{', query)) is not None:
+        return [m.group(1)]
+    return []
+
+
+def raw_metric_name(name):
+    """ Return the metric recorded by a rule of recording_rules. """
+    if (m := re.fullmatch(r'sockshop_\w+:(.+):rate1m', name)) is not None:
+        return m.group(1)
+    return name
+
+
+class SyntheticDataset:
+    """
+    metrics_num metrics per group, every one of which has series_num series,
+    a half of the metrics are counters. A series lacks a point at gap_rate.
+    """
+    def __init__(self, metrics_num, series_num, gap_rate=0.0):
+        self.metrics_num = metrics_num
+        self.series_num = series_num
+        self.gap_rate = gap_rate
+        components = sorted(get_metrics_from_prom.COMPONENT_LABELS)
+        self.labels = {
+            'containers': [{
+                'container': c, 'pod': '{}-5d8f7b9c4-x{}'.format(c, i),
+                'instance': NODES[i % len(NODES)], 'job': 'kubernetes-cadvisor',
+                'node': NODES[i % len(NODES)],
+            } for i, c in enumerate((components * series_num)[:series_num])],
+            'pods': [{
+                'job': MIDDLEWARES[i % len(MIDDLEWARES)], 'instance': 'pod-{}'.format(i),
+            } for i in range(series_num)],
+            'nodes': [{
+                'node': NODES[i % len(NODES)], 'instance': NODES[i % len(NODES)],
+                'job': 'monitoring/node-exporter', 'cpu': str(i),
+            } for i in range(series_num)],
+            'services': [{'name': c} for c in components if not c.endswith('-db')],
+        }
+
+    def targets(self, group):
+        return [{
+            'metric': '{}_metric_{}'.format(group, i),
+            'type': 'counter' if i % 2 else 'gauge',
+        } for i in range(self.metrics_num)]
+
+    def series(self, group, name, start, end, step):
+        for i, label in enumerate(self.labels[group]):
+            seed = zlib.crc32('{}/{}'.format(raw_metric_name(name), i).encode()) & 0xffff
+            values = []
+            for ts in range(start, end + 1, step):
+                k = (ts // step) * 2654435761 + seed
+                if self.gap_rate > 0 and (k % 1000) < self.gap_rate * 1000:
+                    continue
+                values.append([ts, '{:.4f}'.format(10 + 5 * math.sin(ts / 600 + seed))])
+            yield dict(label, **({'__name__': name} if name else {})), values
+
+
+class RecordedDataset:
+    """ Serve the series of a capture recorded by get_metrics_from_prom.py. """
+    def __init__(self, path):
+        data = get_metrics_from_prom.load_capture(path)
+        self.meta = data['meta']
+        self.series_by_name = {}
+        for group, kind in (('containers', 'containers'), ('pods', 'middlewares'),
+                            ('nodes', 'nodes'), ('services', 'services')):
+            for metrics in data[kind].values():
+                for m in metrics:
+                    label = self._labels(group, m)
+                    values = [v for v in m['values'] if v[1] != 'nan']
+                    self.series_by_name.setdefault((group, m['metric_name']), []).append((label, values))
+
+    @staticmethod
+    def _labels(group, m):
+        if group == 'containers':
+            return {'container': m['container_name'], 'instance': NODES[0],
+                    'pod': '{}-5d8f7b9c4-x0'.format(m['container_name'])}
+        if group == 'pods':
+            return {'job': m['container_name']}
+        if group == 'nodes':
+            return {'node': m['node_name'], 'instance': m['node_name']}
+        return {'name': m['service_name']}
+
+    def targets(self, group):
+        return [{'metric': name, 'type': 'gauge'}
+                for g, name in self.series_by_name if g == group]
+
+    def series(self, group, name, start, end, step):
+        if group == 'services':
+            name = 'latency' if '/' in name else 'throughput'
+        for label, values in self.series_by_name.get((group, name), []):
+            yield dict(label, __name__=name), [v for v in values if start <= v[0] <= end]
+
+
+class FakePrometheus(ThreadingHTTPServer):
+    daemon_threads = True
+    # the collector opens up to max_workers connections at once, which
+    # overflow the default backlog of 5 and stall on SYN retransmission.
+    request_queue_size = 128
+
+    def __init__(self, address, dataset, latency=0.0, targets_per_metric=1):
+        super().__init__(address, FakePrometheusHandler)
+        self.dataset = dataset
+        self.latency = latency
+        self.targets_per_metric = targets_per_metric
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'requests': 0, 'metadata': 0, 'query_range': 0, 'connections': set()}
+
+    def count(self, kind, client_address):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats[kind] += 1
+            self.stats['connections'].add(client_address)
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+
+class FakePrometheusHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body):
+        body = body.encode() if isinstance(body, str) else body
+        headers = {'Content-Type': 'application/json'}
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(code)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _params(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        if self.command == 'POST':
+            length = int(self.headers.get('Content-Length', 0))
+            params.update(urllib.parse.parse_qs(self.rfile.read(length).decode()))
+        return url.path, {k: v[0] for k, v in params.items()}
+
+    def _handle(self):
+        path, params = self._params()
+        server = self.server
+        if path == '/-/stats':
+            stats = dict(server.stats, connections=len(server.stats['connections']))
+            return self._send(200, json.dumps(stats))
+        if path == '/-/reset':
+            server.reset_stats()
+            return self._send(200, '{}')
+
+        time.sleep(server.latency)
+        if path == '/api/v1/targets/metadata':
+            server.count('metadata', self.client_address)
+            targets = server.dataset.targets(query_group(params['match_target']))
+            data = [dict(t, target={'instance': str(i)}, help='', unit='')
+                    for t in targets for i in range(server.targets_per_metric)]
+            return self._send(200, json.dumps({'status': 'success', 'data': data}))
+        if path == '/api/v1/query_range':
+            server.count('query_range', self.client_address)
+            query = params['query']
+            start, end = int(float(params['start'])), int(float(params['end']))
+            step = int(params['step'].rstrip('s'))
+            group = query_group(query)
+            names = [query] if group == 'services' else query_metric_names(query)
+            result = []
+            for name in names:
+                for label, values in server.dataset.series(group, name, start, end, step):
+                    if group == 'services' or not re.search(r'__name__=~', query):
+                        label.pop('__name__', None)
+                    if values:
+                        result.append({'metric': label, 'values': values})
+            return self._send(200, json.dumps({
+                'status': 'success', 'data': {'resultType': 'matrix', 'result': result}}))
+        self._send(404, json.dumps({'status': 'error', 'error': 'not found'}))
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", help="listen port", type=int, default=9090)
+    parser.add_argument("--dataset", help="capture of get_metrics_from_prom.py to serve", type=str)
+    parser.add_argument("--metrics-num", help="number of synthetic metrics per group", type=int, default=100)
+    parser.add_argument("--series-num", help="number of synthetic series per metric", type=int, default=14)
+    parser.add_argument("--gap-rate", help="rate of lacking points of synthetic series", type=float, default=0.0)
+    parser.add_argument("--latency", help="seconds to delay each request", type=float, default=0.0)
+    parser.add_argument("--targets-per-metric", help="number of targets per metric in metadata",
+                        type=int, default=1)
+    args = parser.parse_args()
+
+    if args.dataset is not None:
+        dataset = RecordedDataset(args.dataset)
+    else:
+        dataset = SyntheticDataset(args.metrics_num, args.series_num, args.gap_rate)
+    server = FakePrometheus(('127.0.0.1', args.port), dataset, args.latency, args.targets_per_metric)
+    print("serving on {}".format(server.url), file=sys.stderr)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
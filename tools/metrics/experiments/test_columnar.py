@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+""" Check that a columnar capture reads back to the same values as the JSON one """
+
+import copy
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+CUR_DIR = os.fspath(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(CUR_DIR, '..'))
+
+import columnar  # noqa: E402
+import get_metrics_from_prom  # noqa: E402
+
+STEP = 15
+
+
+def capture(start, end, rng):
+    timestamps = range(start, end + 1, STEP)
+
+    def values():
+        # the strings with trailing zeros are canonicalized by the columnar layout.
+        return [[ts, 'nan' if rng.random() < 0.1 else '{:.4f}'.format(rng.uniform(0, 100))]
+                for ts in timestamps]
+
+    return {
+        'meta': {'start': start, 'end': end, 'step': STEP,
+                 'count': {'sum': 3, 'containers': 2, 'middlewares': 0, 'services': 1, 'nodes': 0},
+                 'grafana_dashboard_url': 'http://grafana/?from={}000'.format(start),
+                 'targets': {}},
+        'mappings': {'nodes-containers': {'node1': ['carts']}},
+        'containers': {'carts': [
+            {'container_name': 'carts', 'metric_name': 'container_cpu_usage_seconds_total',
+             'values': values()},
+            {'container_name': 'carts', 'metric_name': 'container_memory_usage_bytes',
+             'values': values()},
+        ]},
+        'middlewares': {},
+        'services': {'carts': [
+            {'service_name': 'carts', 'metric_name': 'throughput', 'values': values()},
+        ]},
+        'nodes': {},
+    }
+
+
+def to_columnar(data):
+    buf = io.BytesIO()
+    columnar.dump(data, buf)
+    with tempfile.NamedTemporaryFile(suffix='.col', delete=False) as f:
+        f.write(buf.getvalue())
+    try:
+        return columnar.load(f.name)
+    finally:
+        os.unlink(f.name)
+
+
+def assert_same_values(actual, expected):
+    for kind in columnar.KINDS:
+        assert actual[kind].keys() == expected[kind].keys()
+        for name, metrics in expected[kind].items():
+            assert len(actual[kind][name]) == len(metrics)
+            for a, e in zip(actual[kind][name], metrics):
+                assert a['metric_name'] == e['metric_name']
+                assert [ts for ts, _ in a['values']] == [ts for ts, _ in e['values']]
+                assert np.array_equal(np.array([v for _, v in a['values']], dtype=np.float64),
+                                      np.array([v for _, v in e['values']], dtype=np.float64),
+                                      equal_nan=True)
+
+
+def test_load_round_trip():
+    data = capture(1000, 1000 + STEP * 100, np.random.default_rng(0))
+    assert_same_values(to_columnar(copy.deepcopy(data)), data)
+
+
+def test_append_to_columnar():
+    rng = np.random.default_rng(1)
+    full = capture(1000, 1000 + STEP * 199, rng)
+    base, new = copy.deepcopy(full), copy.deepcopy(full)
+    base['meta']['end'] = 1000 + STEP * 99
+    new['meta']['start'] = 1000 + STEP * 100
+    for kind in columnar.KINDS:
+        for b, n in zip(sum(base[kind].values(), []), sum(new[kind].values(), [])):
+            b['values'], n['values'] = b['values'][:100], n['values'][100:]
+
+    merged = get_metrics_from_prom.merge_captures(to_columnar(base), new)
+    assert_same_values(to_columnar(merged), full)
+
+
+if __name__ == '__main__':
+    test_load_round_trip()
+    test_append_to_columnar()
+    print("ok")
@@ -35,11 +35,20 @@
 """
 
 import argparse
-import concurrent.futures
 import datetime
+import functools
+import hashlib
 import json
+import os
 import sys
-import urllib.request
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import columnar
+import promclient
 
 COMPONENT_LABELS = {
     "front-end", "orders", "orders-db", "carts", "carts-db",
@@ -50,121 +59,247 @@ APP_LABEL = 'sock-shop'
 APP_NODEPOOL = 'default-pool'
 STEP = 15
 NAN = 'nan'
+# maximum number of points per series of a range query shard.
+# prometheus rejects a query_range over 11,000 points per series.
+SHARD_POINTS = 1440
+MAX_SHARD_POINTS = 11000
+TARGETS_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'get_metrics_from_prom')
+TARGETS_CACHE_TTL = 3600
 GRAFANA_DASHBOARD = "d/3cHU4RSMk/sock-shop-performance"
 
 
-def get_targets(url, selector):
+class TargetsCache:
+    """
+    On-disk cache of the targets discovered by get_targets, keyed by the
+    prometheus URL and the selector. An entry older than ttl seconds is
+    discovered again, and ttl <= 0 disables the cache.
+    """
+    def __init__(self, cache_dir, ttl):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def _path(self, url, selector):
+        key = hashlib.sha256('{}\0{}'.format(url, selector).encode()).hexdigest()
+        return os.path.join(self.cache_dir, 'targets-{}.json'.format(key))
+
+    def get(self, url, selector):
+        if self.ttl <= 0:
+            return None
+        try:
+            with open(self._path(url, selector)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url or entry.get('selector') != selector or \
+                time.time() - entry.get('fetched_at', 0) > self.ttl:
+            return None
+        return entry['targets']
+
+    def put(self, url, selector, targets):
+        if self.ttl <= 0:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(url, selector)
+        # write into a unique temporary file since the groups are discovered concurrently.
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.targets-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'url': url, 'selector': selector,
+                       'fetched_at': time.time(), 'targets': targets}, f)
+        os.replace(tmp, path)
+
+
+def get_targets(client, selector, cache=None):
+    if cache is not None and (targets := cache.get(client.url, selector)) is not None:
+        return targets
+
     params = {
         "match_target": '{' + selector + '}',
     }
-    req = urllib.request.Request('{}{}?{}'.format(
-        url, "/api/v1/targets/metadata",
-        urllib.parse.urlencode(params)))
-    dupcheck = {}
-    targets = []
-    with urllib.request.urlopen(req) as res:
-        body = json.load(res)
-        # remove duplicate target
-        for item in body["data"]:
-            if item["metric"] not in dupcheck:
-                targets.append({"metric": item["metric"], "type": item["type"]})
-                dupcheck[item["metric"]] = 1
-        return targets
+    body = client.request("/api/v1/targets/metadata", params, method='GET')
+    # remove duplicate target
+    types = {}
+    for item in body["data"]:
+        types.setdefault(item["metric"], item["type"])
+    targets = [{"metric": metric, "type": type_} for metric, type_ in types.items()]
 
+    if cache is not None:
+        cache.put(client.url, selector, targets)
+    return targets
 
-def request_query_range(url, params, target):
-    bparams = urllib.parse.urlencode(params).encode('ascii')
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-    }
-    try:
-        # see https://prometheus.io/docs/prometheus/latest/querying/api/#range-queries
-        req = urllib.request.Request(url=url+'/api/v1/query_range',
-                                     data=bparams, headers=headers)
-        with urllib.request.urlopen(req) as res:
-            body = json.load(res)
-            metrics = body['data']['result']
-            if metrics is None or len(metrics) < 1:
-                return []
-            for metric in metrics:
-                metric['metric']['__name__'] = target['metric']
-            return metrics
-    except urllib.error.HTTPError as err:
-        print(urllib.parse.unquote(bparams.decode()), file=sys.stderr)
-        print(err.read().decode(), file=sys.stderr)
-        raise(err)
-    except urllib.error.URLError as err:
-        print(err.reason, file=sys.stderr)
-        raise(err)
-    except Exception as e:
-        raise(e)
-
-
-def get_metrics(url, targets, start, end, step, selector):
-    futures = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-        for target in targets:
-            if target == 'node_cpu_seconds_total':
-                selector += ',mode!="idle"'
-            query = '{0}{{{1}}}'.format(target['metric'], selector)
-            if target['type'] == 'counter':
-                query = 'rate({}[1m])'.format(query)
-            query = 'sum by (instance,job,node,container,pod)({})'.format(query)
-            params = {
-                "query": query,
-                "start": start,
-                "end": end,
-                "step": '{}s'.format(step),
-            }
-            res = executor.submit(request_query_range, url, params, target)
-            futures.append(res)
-        executor.shutdown()
-
-    concated_metrics = []
-    for future in concurrent.futures.as_completed(futures):
-        metrics = future.result()
-        if metrics is None:
+
+def request_query_range(client, params, target, consume):
+    """
+    Run a range query and pass each series of the result to consume as
+    soon as it is decoded from the response.
+    """
+    # see https://prometheus.io/docs/prometheus/latest/querying/api/#range-queries
+    for metric in client.stream('/api/v1/query_range', params):
+        metric['metric']['__name__'] = target['metric']
+        consume(metric)
+
+
+def request_batched_query_range(client, params, names, consume):
+    """
+    Run a range query of several metrics and pass each series to consume
+    with its metric name, which is mapped by names from '__name__' of the
+    series, such as the name of a recording rule, to the target metric.
+    """
+    for metric in client.stream('/api/v1/query_range', params):
+        name = names.get(metric['metric'].get('__name__'))
+        if name is None:
             continue
-        concated_metrics += metrics
-    return concated_metrics
+        metric['metric']['__name__'] = name
+        consume(metric)
 
 
-def get_metrics_by_query_range(url, start, end, step, query, target):
-    params = {
-        "query": query,
-        "start": start,
-        "end": end,
-        "step": '{}s'.format(step),
-    }
-    return request_query_range(url, params, target)
+def split_time_range(start, end, step, max_points):
+    """
+    Split the range from start to end into step-aligned shards of at most
+    max_points points. The shards do not overlap each other.
+    """
+    shards = []
+    shard_len = step * max_points
+    for shard_start in range(start, end + 1, shard_len):
+        shards.append((shard_start, min(end, shard_start + shard_len - step)))
+    return shards
 
 
-def interpotate_time_series(values, time_meta):
-    start, end, step = time_meta['start'], time_meta['end'], time_meta['step']
-    new_values = []
+def submit_query_range(client, query, start, end, step, target, consume, max_points=SHARD_POINTS,
+                       request=request_query_range):
+    """
+    Submit the range query split into time shards to the pool of the client
+    and return the futures of the shards.
+    """
+    futures = []
+    for shard_start, shard_end in split_time_range(start, end, step, max_points):
+        params = {
+            "query": query,
+            "start": shard_start,
+            "end": shard_end,
+            "step": '{}s'.format(step),
+        }
+        futures.append(client.submit(request, client, params, target, consume))
+    return futures
 
-    # start check
-    if (lost_num := int((values[0][0] - start) / step)-1) > 0:
-        for j in range(lost_num):
-            new_values.append([start + step*j, NAN])
 
-    for i, val in enumerate(values):
-        if i+1 >= len(values):
-            new_values.append(val)
-            break
-        cur_ts, next_ts = val[0], values[i+1][0]
-        new_values.append(val)
-        if (lost_num := int((next_ts - cur_ts) / step)-1) > 0:
-            for j in range(lost_num):
-                new_values.append([cur_ts + step*(j+1), NAN])
+def recorded_metric_name(group, metric):
+    """ Return the name of the recording rule of rate() of a counter. """
+    return 'sockshop_{}:{}:rate1m'.format(group, metric)
 
-    # end check
-    last_ts = values[-1][0]
-    if (lost_num := int((end - last_ts) / step)) > 0:
-        for j in range(lost_num):
-            new_values.append([last_ts + step*(j+1), NAN])
 
-    return new_values
+def recording_rules(targets, selectors):
+    """
+    Return the prometheus rule file in YAML of the recording rules, which
+    compute rate() of the counter targets of the groups.
+    """
+    lines = ['groups:']
+    for group, group_targets in targets.items():
+        _, selector = selectors[group]
+        counters = [target['metric'] for target in group_targets if target['type'] == 'counter']
+        if len(counters) < 1:
+            continue
+        lines += ['- name: {}'.format(json.dumps('get_metrics_from_prom_{}'.format(group))), '  rules:']
+        for metric in counters:
+            lines += [
+                '  - record: {}'.format(json.dumps(recorded_metric_name(group, metric))),
+                '    expr: {}'.format(json.dumps('rate({}{{{}}}[1m])'.format(metric, selector))),
+            ]
+    return '\n'.join(lines)
+
+
+def submit_metrics(client, targets, start, end, step, selector, consume, max_points=SHARD_POINTS,
+                   batch_size=1, rules_group=None):
+    """
+    Submit the range queries of the targets to the pool of the client
+    and return the futures without waiting for them.
+    If batch_size > 1, the gauges are queried by batch_size metrics at once
+    with a regex of '__name__', and so are the counters if rules_group is
+    given, whose rate() is computed by the recording rules of the group.
+    """
+    futures = []
+    batched = {}
+    for target in targets:
+        if target == 'node_cpu_seconds_total':
+            selector += ',mode!="idle"'
+        if batch_size > 1:
+            if target['type'] != 'counter':
+                batched[target['metric']] = target['metric']
+                continue
+            if rules_group is not None:
+                batched[recorded_metric_name(rules_group, target['metric'])] = target['metric']
+                continue
+        query = '{0}{{{1}}}'.format(target['metric'], selector)
+        if target['type'] == 'counter':
+            query = 'rate({}[1m])'.format(query)
+        query = 'sum by (instance,job,node,container,pod)({})'.format(query)
+        futures += submit_query_range(client, query, start, end, step, target, consume, max_points)
+
+    names = list(batched.items())
+    for i in range(0, len(names), batch_size):
+        batch = dict(names[i:i+batch_size])
+        query = 'sum by (__name__,instance,job,node,container,pod)({{__name__=~"{0}",{1}}})'.format(
+            '|'.join(batch), selector)
+        futures += submit_query_range(client, query, start, end, step, batch, consume, max_points,
+                                      request=request_batched_query_range)
+    return futures
+
+
+class MetricsResultBuilder:
+    """
+    Collect the series of the range queries as they are decoded by the
+    worker threads. Each shard of a series, identified by its labels, is
+    placed onto the float64 grid of the series from start to end by step
+    as soon as it arrives, so that the raw [<timestamp>, '<value>'] pairs
+    are released right away and only the grids stay in memory. A point
+    duplicated at the boundary of the shards lands on the same slot.
+    """
+    GROUPS = ('containers', 'pods', 'nodes', 'throughput', 'latency')
+
+    def __init__(self, start, end, step):
+        self.start, self.end, self.step = start, end, step
+        self._lock = threading.Lock()
+        self._series = {group: {} for group in self.GROUPS}
+        # the targets of the groups queried for the metrics
+        self.targets = {}
+
+    def add(self, group, metric):
+        values = metric['values']
+        if not values:
+            return
+        key = tuple(sorted(metric['metric'].items()))
+        with self._lock:
+            series = self._series[group]
+            if key not in series:
+                series[key] = (metric['metric'], np.full((self.end - self.start) // self.step + 1, np.nan))
+            columnar.place_time_series(series[key][1], values, self.start, self.end, self.step)
+
+    def consumer(self, group):
+        return functools.partial(self.add, group)
+
+    def pop_series(self, group):
+        """ Yield the series of the group in the order of arrival. """
+        series = self._series[group]
+        while series:
+            labels, grid = series.pop(next(iter(series)))
+            yield {'metric': labels, 'values': grid}
+
+    def build(self, time_meta, injected_meta):
+        data = metrics_as_result(
+            self.pop_series('containers'), self.pop_series('pods'),
+            self.pop_series('nodes'), self.pop_series('throughput'),
+            self.pop_series('latency'), time_meta, injected_meta,
+        )
+        # keep the targets so that a later run can append to the capture.
+        data['meta']['targets'] = self.targets
+        return data
+
+
+def wait_metrics(futures):
+    # raise the first error of the requests if any.
+    for future in futures:
+        future.result()
 
 
 def support_set_default(obj):
@@ -175,6 +310,11 @@ def support_set_default(obj):
 
 def metrics_as_result(container_metrics, pod_metrics, node_metrics,
                       throughput_metrics, latency_metrics, time_meta, injected_meta):
+    """
+    Arrange the series of MetricsResultBuilder into the layout of a capture,
+    where the values of each series stay the float64 grid from start to end
+    until they are written by write_result.
+    """
     start, end = time_meta['start'], time_meta['end']
     grafana_url = time_meta['grafana_url']
     dashboard_url = f"{grafana_url}/{GRAFANA_DASHBOARD}?orgId=1&from={start}000&to={end}000"
@@ -199,8 +339,15 @@ def metrics_as_result(container_metrics, pod_metrics, node_metrics,
         'containers': {}, 'middlewares': {}, 'nodes': {}, 'services': {},
     }
     data['meta'].update(injected_meta)
+    count = data['meta']['count']
 
-    dupcheck = {}
+    def append_metric(kind, name, m):
+        data[kind][name].append(m)
+        count[kind] += 1
+        count['sum'] += 1
+
+    # (container, metric name) -> index in the list of the container
+    slots = {}
     for metric in container_metrics:
         # some metrics in results of prometheus query has no '__name__'
         labels = metric['metric']
@@ -211,27 +358,21 @@ def metrics_as_result(container_metrics, pod_metrics, node_metrics,
         data['containers'].setdefault(container, [])
         metric_name = labels['__name__']
 
-        values = interpotate_time_series(metric['values'], time_meta)
-        m = {
-            'container_name': container,
-            'metric_name': metric_name,
-            'values': values,
-        }
-
         # 1. {container: 'POD'} => {container: 'xxx' } -> Update 'POD'
         # 2. {container: 'xxx'} => {container: 'POD' } -> Discard 'POD'
         # 3. {container: 'POD'}
-        dupcheck.setdefault(container, {})
-        dupcheck[container][metric_name] = False
-        if labels['container'] == 'POD':
-            if not dupcheck[container][metric_name]:
-                data['containers'][container].append(m)
-        else:
-            if not dupcheck[container][metric_name]:
-                uniq_metrics = [x for x in data['containers'][container] if x['metric_name'] != metric_name]
-                uniq_metrics.append(m)
-                data['containers'][container] = uniq_metrics
-                dupcheck[container][metric_name] = True
+        slot = slots.get((container, metric_name))
+        if slot is None or labels['container'] != 'POD':
+            m = {
+                'container_name': container,
+                'metric_name': metric_name,
+                'values': metric['values'],
+            }
+            if slot is None:
+                slots[(container, metric_name)] = len(data['containers'][container])
+                append_metric('containers', container, m)
+            else:
+                data['containers'][container][slot] = m
 
         # Update mappings for nods and containers
         data['mappings']['nodes-containers'].setdefault(labels['instance'], set())
@@ -242,13 +383,12 @@ def metrics_as_result(container_metrics, pod_metrics, node_metrics,
             continue
         container = metric['metric']['job']
         data['middlewares'].setdefault(container, [])
-        values = interpotate_time_series(metric['values'], time_meta)
         m = {
             'container_name': container,
             'metric_name': metric['metric']['__name__'],
-            'values': values,
+            'values': metric['values'],
         }
-        data['middlewares'][container].append(m)
+        append_metric('middlewares', container, m)
 
     for metric in node_metrics:
         # some metrics in results of prometheus query has no '__name__'
@@ -256,55 +396,195 @@ def metrics_as_result(container_metrics, pod_metrics, node_metrics,
             continue
         node = metric['metric']['node']
         data['nodes'].setdefault(node, [])
-        values = interpotate_time_series(metric['values'], time_meta)
         m = {
             'node_name': node,
             'metric_name': metric['metric']['__name__'],
-            'values': values,
+            'values': metric['values'],
         }
-        data['nodes'][node].append(m)
+        append_metric('nodes', node, m)
 
     for metric in throughput_metrics:
         service = metric['metric']['name']
         data['services'].setdefault(service, [])
-        values = interpotate_time_series(metric['values'], time_meta)
         m = {
             'service_name': metric['metric']['name'],
             'metric_name': 'throughput',
-            'values': values,
+            'values': metric['values'],
         }
-        data['services'][service].append(m)
+        append_metric('services', service, m)
 
     for metric in latency_metrics:
         service = metric['metric']['name']
         data['services'].setdefault(service, [])
-        values = interpotate_time_series(metric['values'], time_meta)
         m = {
             'service_name': metric['metric']['name'],
             'metric_name': 'latency',
-            'values': values,
+            'values': metric['values'],
         }
-        data['services'][service].append(m)
-
-    # Count the number of metric series.
-    containers_cnt, middlewares_cnt, services_cnt, nodes_cnt = 0, 0, 0, 0
-    for metrics in data['containers'].values():
-        containers_cnt += len(metrics)
-    for metrics in data['middlewares'].values():
-        middlewares_cnt += len(metrics)
-    for metrics in data['services'].values():
-        services_cnt += len(metrics)
-    for metrics in data['nodes'].values():
-        nodes_cnt += len(metrics)
-    data['meta']['count']['containers'] = containers_cnt
-    data['meta']['count']['middlewares'] = middlewares_cnt
-    data['meta']['count']['services'] = services_cnt
-    data['meta']['count']['nodes'] = nodes_cnt
-    data['meta']['count']['sum'] = containers_cnt + middlewares_cnt + services_cnt + nodes_cnt
+        append_metric('services', service, m)
 
     return data
 
 
+def target_selectors():
+    """
+    Return the selectors of the groups of targets, which are pairs of the
+    selector to discover the targets and the selector to query them.
+    """
+    # container metrics (cAdvisor)
+    # add container=POD for network metrics
+    # exclude metrics of argo workflow pods by removing metrics that 'instance' is gke control-pool node.
+    comp_list = '|'.join(sorted(COMPONENT_LABELS))
+    container_selector = f"namespace='sock-shop',container=~'{comp_list}|POD',nodepool='{APP_NODEPOOL}'"
+    # pod metrics
+    pod_selector = 'app="{}"'.format(APP_LABEL)
+    # node metrics (node-exporter)
+    node_selector = f"job='monitoring/node-exporter',node=~'.+-{APP_NODEPOOL}-.+'"
+    selectors = {
+        'containers': ('job=~"kubernetes-cadvisor"', container_selector),
+        'pods': (pod_selector, pod_selector),
+        'nodes': (node_selector, node_selector),
+    }
+    return selectors
+
+
+def discover_targets(client, targets_cache=None):
+    selectors = target_selectors()
+    futures = {
+        group: client.submit(get_targets, client, targets_selector, targets_cache)
+        for group, (targets_selector, _) in selectors.items()
+    }
+    return {group: future.result() for group, future in futures.items()}
+
+
+def fetch_all_metrics(client, start, end, step, max_points=SHARD_POINTS, targets=None, targets_cache=None,
+                      batch_size=1, use_recording_rules=False):
+    """
+    Fetch the metrics of all the target groups concurrently into a
+    MetricsResultBuilder. The requests of every group share the pool of
+    the client, so that the number of in-flight requests is bounded by
+    its max_workers.
+    The targets of a group are discovered unless they are given in targets,
+    through targets_cache if any.
+    See submit_metrics for batch_size and use_recording_rules.
+    """
+    targets = targets or {}
+    builder = MetricsResultBuilder(start, end, step)
+    selectors = target_selectors()
+    targets_futures = {
+        group: client.submit(get_targets, client, targets_selector, targets_cache)
+        for group, (targets_selector, _) in selectors.items() if group not in targets
+    }
+
+    # service metrics
+    throughput_futures = submit_query_range(
+        client, """
+            sum by (name) (
+                rate(
+                    request_duration_seconds_count{
+                        job="kubernetes-service-endpoints",
+                        kubernetes_namespace="sock-shop"
+                    }[1m]
+                )
+            )
+            """,
+        start, end, step, {'metric': 'request_duration_seconds_count', 'type': 'gauge'},
+        builder.consumer('throughput'), max_points,
+    )
+    latency_futures = submit_query_range(
+        client, """
+            sum by (name) (
+                rate(
+                    request_duration_seconds_sum{
+                        job="kubernetes-service-endpoints",
+                        kubernetes_namespace="sock-shop"
+                    }[1m]
+                )
+            ) / sum by (name) (
+                rate(
+                    request_duration_seconds_count{
+                        job="kubernetes-service-endpoints",
+                        kubernetes_namespace="sock-shop"
+                    }[1m]
+                )
+            )
+            """,
+        start, end, step, {'metric': 'request_duration_seconds_sum', 'type': 'gauge'},
+        builder.consumer('latency'), max_points,
+    )
+
+    # submit the range queries of a group as soon as its targets are known.
+    metrics_futures = throughput_futures + latency_futures
+    for group, (_, selector) in selectors.items():
+        if group in targets:
+            builder.targets[group] = targets[group]
+        else:
+            builder.targets[group] = targets_futures[group].result()
+        metrics_futures += submit_metrics(client, builder.targets[group], start, end, step, selector,
+                                          builder.consumer(group), max_points, batch_size,
+                                          group if use_recording_rules else None)
+    wait_metrics(metrics_futures)
+    return builder
+
+
+def load_capture(path):
+    if columnar.is_columnar(path):
+        return columnar.load(path)
+    with open(path) as f:
+        return json.load(f)
+
+
+def merge_captures(base, new):
+    """
+    Append the series of the capture new, which starts right after the end
+    of the capture base, to the series of base in place. A series missing
+    in either capture is filled with 'nan' over the range of that capture.
+    The series of a component are matched by metric name in the order of
+    their occurrence, since a component can have several series of a metric.
+    The float64 grids of the series of new are expanded into the pairs.
+    """
+    base_meta, new_meta = base['meta'], new['meta']
+    step = base_meta['step']
+    base_timestamps = range(base_meta['start'], base_meta['end'] + 1, step)
+    new_timestamps = range(new_meta['start'], new_meta['end'] + 1, step)
+    count = base_meta['count']
+
+    for kind in columnar.KINDS:
+        base_kind, new_kind = base.setdefault(kind, {}), new.get(kind, {})
+        for name in base_kind.keys() | new_kind.keys():
+            base_metrics = base_kind.setdefault(name, [])
+            slots = {}
+            for i, m in enumerate(base_metrics):
+                slots.setdefault(m['metric_name'], []).append(i)
+            appended = set()
+            for m in new_kind.get(name, []):
+                if isinstance(m['values'], np.ndarray):
+                    m['values'] = columnar.as_pairs(new_timestamps, m['values'])
+                if slots.get(m['metric_name']):
+                    i = slots[m['metric_name']].pop(0)
+                    base_metrics[i]['values'] += m['values']
+                else:
+                    m['values'] = [[ts, NAN] for ts in base_timestamps] + m['values']
+                    i = len(base_metrics)
+                    base_metrics.append(m)
+                    count[kind] += 1
+                    count['sum'] += 1
+                appended.add(i)
+            for i, m in enumerate(base_metrics):
+                if i not in appended:
+                    m['values'] += [[ts, NAN] for ts in new_timestamps]
+
+    for node, containers in new['mappings']['nodes-containers'].items():
+        base_containers = base['mappings']['nodes-containers'].setdefault(node, [])
+        base_containers += [c for c in containers if c not in base_containers]
+
+    base_meta['end'] = new_meta['end']
+    base_meta['grafana_dashboard_url'] = new_meta['grafana_dashboard_url'].replace(
+        "from={}000".format(new_meta['start']), "from={}000".format(base_meta['start']))
+    base_meta['targets'] = new_meta['targets']
+    return base
+
+
 def get_unix_time(timestamp):
     if timestamp.isdigit():  # check unix time
         return int(timestamp)
@@ -352,6 +632,35 @@ def time_range_from_args(params):
     return start, end
 
 
+def write_result(result, out, out_format):
+    meta = result['meta']
+    timestamps = range(meta['start'], meta['end'] + 1, meta['step'])
+
+    def json_default(obj):
+        # expand the grid of a series into the pairs only while it is encoded.
+        if isinstance(obj, np.ndarray):
+            return columnar.as_pairs(timestamps, obj)
+        return support_set_default(obj)
+
+    if out is None:
+        if out_format == 'columnar':
+            columnar.dump(result, sys.stdout.buffer, default=support_set_default)
+        else:
+            json.dump(result, sys.stdout, default=json_default)
+            print()
+        return
+
+    # write into a temporary file not to break the capture to be appended to on failure.
+    tmp = out + '.tmp'
+    if out_format == 'columnar':
+        with open(tmp, mode='wb') as f:
+            columnar.dump(result, f, default=support_set_default)
+    else:
+        with open(tmp, mode='w') as f:
+            json.dump(result, f, default=json_default)
+    os.replace(tmp, out)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--prometheus-url",
@@ -366,16 +675,81 @@ def main():
     parser.add_argument("--duration", help="", type=str, default="30m")
     parser.add_argument("--chaos-injected-component", help="chaos-injected component")
     parser.add_argument("--injected-chaos-type", help="chaos type such as 'pod-cpu-hog'")
+    parser.add_argument("--max-workers",
+                        help="maximum number of concurrent requests to prometheus",
+                        type=int, default=promclient.MAX_WORKERS)
+    parser.add_argument("--retries",
+                        help="number of retries of a failed request",
+                        type=int, default=promclient.RETRIES)
+    parser.add_argument("--timeout", help="timeout seconds of a request",
+                        type=float, default=promclient.TIMEOUT)
+    parser.add_argument("--shard-points",
+                        help="maximum number of points per series of a range query",
+                        type=int, default=SHARD_POINTS)
+    parser.add_argument("--targets-cache-dir",
+                        help="directory of the cache of discovered targets",
+                        type=str, default=TARGETS_CACHE_DIR)
+    parser.add_argument("--targets-cache-ttl",
+                        help="seconds to reuse the cached targets, 0 disables the cache",
+                        type=int, default=TARGETS_CACHE_TTL)
+    parser.add_argument("--batch-size",
+                        help="number of metrics queried at once, 1 queries the metrics one by one",
+                        type=int, default=1)
+    parser.add_argument("--use-recording-rules",
+                        help="query rate() of the counters from the recording rules in batch mode",
+                        action='store_true')
+    parser.add_argument("--print-recording-rules",
+                        help="print the prometheus rule file of the recording rules and exit",
+                        action='store_true')
     parser.add_argument("--out", help="output path", type=str)
+    parser.add_argument("--format", help="output format (default: json, or the format of --append-to)",
+                        choices=['json', 'columnar'])
+    parser.add_argument("--append-to",
+                        help="path of a capture to append the metrics after its end to, "
+                        "which is overwritten unless --out is given",
+                        type=str)
     args = parser.parse_args()
 
+    if not 0 < args.shard_points <= MAX_SHARD_POINTS:
+        print("shard-points must be between 1 and {}.".format(MAX_SHARD_POINTS), file=sys.stderr)
+        parser.print_help()
+        exit(-1)
+
+    if args.print_recording_rules:
+        with promclient.PrometheusClient(
+            args.prometheus_url, max_workers=args.max_workers,
+            retries=args.retries, timeout=args.timeout,
+        ) as client:
+            targets = discover_targets(
+                client, TargetsCache(args.targets_cache_dir, args.targets_cache_ttl))
+        print(recording_rules(targets, target_selectors()))
+        return
+
+    base, targets, out_format, out = None, None, args.format or 'json', args.out
+    if args.append_to is not None:
+        base = load_capture(args.append_to)
+        # fetch the metrics after the end of the capture with the same step and targets.
+        # the targets of a capture of an older version are discovered again.
+        args.step = base['meta']['step']
+        targets = base['meta'].get('targets')
+        out_format = args.format or ('columnar' if columnar.is_columnar(args.append_to) else 'json')
+        out = args.out or args.append_to
+
     try:
-        start, end = time_range_from_args({
-            "duration": args.duration,
-            "start": args.start,
-            "end": args.end,
-            "step": args.step,
-        })
+        if base is None:
+            start, end = time_range_from_args({
+                "duration": args.duration,
+                "start": args.start,
+                "end": args.end,
+                "step": args.step,
+            })
+        else:
+            start = base['meta']['end'] + args.step
+            end = get_unix_time(args.end) if args.end else int(datetime.datetime.now().timestamp())
+            end = end - end % args.step
+            if start > end:
+                print("no new metrics after the end of {}.".format(args.append_to), file=sys.stderr)
+                exit(0)
         if start > end:
             print("start must be lower than end.", file=sys.stderr)
             parser.print_help()
@@ -384,83 +758,28 @@ def main():
         print("parsing timestamp error:", e, file=sys.stderr)
         exit(-1)
 
-    # get container metrics (cAdvisor)
-    container_targets = get_targets(args.prometheus_url,
-                                    'job=~"kubernetes-cadvisor"')
-    # add container=POD for network metrics
-    # exclude metrics of argo workflow pods by removing metrics that 'instance' is gke control-pool node.
-    comp_list = '|'.join(COMPONENT_LABELS)
-    container_selector = f"namespace='sock-shop',container=~'{comp_list}|POD',nodepool='{APP_NODEPOOL}'"
-    container_metrics = get_metrics(args.prometheus_url, container_targets,
-                                    start, end, args.step, container_selector)
-
-    # get pod metrics
-    pod_selector = 'app="{}"'.format(APP_LABEL)
-    pod_targets = get_targets(args.prometheus_url, pod_selector)
-    pod_metrics = get_metrics(args.prometheus_url, pod_targets,
-                              start, end, args.step, pod_selector)
-
-    # get node metrics (node-exporter)
-    node_selector = f"job='monitoring/node-exporter',node=~'.+-{APP_NODEPOOL}-.+'"
-    node_targets = get_targets(args.prometheus_url, node_selector)
-    node_metrics = get_metrics(args.prometheus_url, node_targets,
-                               start, end, args.step, node_selector)
-
-    # get service metrics
-    throughput_metrics = get_metrics_by_query_range(
-        args.prometheus_url, start, end, args.step, """
-            sum by (name) (
-                rate(
-                    request_duration_seconds_count{
-                        job="kubernetes-service-endpoints",
-                        kubernetes_namespace="sock-shop"
-                    }[1m]
-                )
-            )
-            """,
-        {'metric': 'request_duration_seconds_count', 'type': 'gauge'},
-    )
-    latency_metrics = get_metrics_by_query_range(
-        args.prometheus_url, start, end, args.step, """
-            sum by (name) (
-                rate(
-                    request_duration_seconds_sum{
-                        job="kubernetes-service-endpoints",
-                        kubernetes_namespace="sock-shop"
-                    }[1m]
-                )
-            ) / sum by (name) (
-                rate(
-                    request_duration_seconds_count{
-                        job="kubernetes-service-endpoints",
-                        kubernetes_namespace="sock-shop"
-                    }[1m]
-                )
-            )
-            """,
-        {'metric': 'request_duration_seconds_sum', 'type': 'gauge'},
-    )
-
-    result = metrics_as_result(
-        container_metrics, pod_metrics,
-        node_metrics, throughput_metrics, latency_metrics, {
-            'start': start,
-            'end': end,
-            'step': args.step,
-            'prometheus_url': args.prometheus_url,
-            'grafana_url': args.grafana_url,
-        }, {
-            'chaos_injected_component': args.chaos_injected_component,
-            'injected_chaos_type': args.injected_chaos_type,
-        }
-    )
-
-    data = json.dumps(result, default=support_set_default)
-    if args.out is None:
-        print(data)
-    else:
-        with open(args.out, mode='w') as f:
-            f.write(data)
+    with promclient.PrometheusClient(
+        args.prometheus_url, max_workers=args.max_workers,
+        retries=args.retries, timeout=args.timeout,
+    ) as client:
+        builder = fetch_all_metrics(client, start, end, args.step, args.shard_points, targets,
+                                    TargetsCache(args.targets_cache_dir, args.targets_cache_ttl),
+                                    args.batch_size, args.use_recording_rules)
+
+    result = builder.build({
+        'start': start,
+        'end': end,
+        'step': args.step,
+        'prometheus_url': args.prometheus_url,
+        'grafana_url': args.grafana_url,
+    }, {
+        'chaos_injected_component': args.chaos_injected_component,
+        'injected_chaos_type': args.injected_chaos_type,
+    })
+    if base is not None:
+        result = merge_captures(base, result)
+
+    write_result(result, out, out_format)
 
 
 if __name__ == '__main__':
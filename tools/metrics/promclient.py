@@ -0,0 +1,212 @@
+""" HTTP client for the Prometheus API
+
+    PrometheusClient keeps one keep-alive connection per worker thread and
+    runs every request on a single thread pool, so that the number of
+    in-flight requests to Prometheus is bounded by max_workers no matter
+    how many target groups are fetched at the same time.
+"""
+
+import codecs
+import concurrent.futures
+import gzip
+import http.client
+import json
+import re
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import zlib
+
+MAX_WORKERS = 20
+RETRIES = 3
+BACKOFF = 0.5
+TIMEOUT = 60
+CHUNK_SIZE = 1 << 16
+
+
+class PrometheusClient:
+    def __init__(self, url, max_workers=MAX_WORKERS, retries=RETRIES,
+                 backoff=BACKOFF, timeout=TIMEOUT):
+        self.url = url
+        parsed = urllib.parse.urlsplit(url)
+        self._scheme, self._netloc = parsed.scheme, parsed.netloc
+        self._base_path = parsed.path.rstrip('/')
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns = []
+
+    def submit(self, fn, *args, **kwargs):
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if self._scheme == 'https' else http.client.HTTPConnection
+            conn = conn_class(self._netloc, timeout=self.timeout)
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+
+    def _open(self, method, path, body, query):
+        """
+        Send a request and return the response of a successful status
+        without reading its body. Connection errors, timeouts and 5xx
+        responses are retried with exponential backoff.
+        """
+        headers = {'Accept-Encoding': 'gzip'}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in range(self.retries + 1):
+            try:
+                conn = self._connection()
+                conn.request(method, self._base_path + path, body=body, headers=headers)
+                res = conn.getresponse()
+                if res.status < 400:
+                    return res
+                data = _read_body(res)
+            except (http.client.HTTPException, ConnectionError, socket.timeout) as err:
+                # the keep-alive connection may have been closed by the server.
+                self._reset_connection()
+                if attempt >= self.retries:
+                    print(err, file=sys.stderr)
+                    raise err
+            else:
+                if res.status < 500 or attempt >= self.retries:
+                    print(urllib.parse.unquote(query), file=sys.stderr)
+                    print(data.decode(errors='replace'), file=sys.stderr)
+                    raise urllib.error.HTTPError(
+                        self.url + path, res.status, res.reason, res.headers, None)
+            time.sleep(self.backoff * (2 ** attempt))
+
+    def _prepare(self, path, params, method):
+        query = urllib.parse.urlencode(params)
+        if method == 'POST':
+            return path, query.encode('ascii'), query
+        return '{}?{}'.format(path, query), None, query
+
+    def request(self, path, params, method='POST'):
+        """
+        Send the params to the API path as a form (POST) or a query string
+        (GET) and return the decoded JSON body.
+        """
+        path, body, query = self._prepare(path, params, method)
+        res = self._open(method, path, body, query)
+        try:
+            return json.loads(_read_body(res))
+        except (http.client.HTTPException, ConnectionError, socket.timeout):
+            self._reset_connection()
+            raise
+
+    def stream(self, path, params, key='result', method='POST'):
+        """
+        Like request, but decode the body incrementally and yield the items
+        of the first array of the key one by one, so that the whole body is
+        never held in memory. An error after the first item is not retried.
+        """
+        path, body, query = self._prepare(path, params, method)
+        res = self._open(method, path, body, query)
+        done = False
+        try:
+            yield from _iter_json_array(_iter_text(res), key)
+            done = True
+        finally:
+            if not done or not res.isclosed():
+                # the body is left unread, so that the connection cannot be reused.
+                self._reset_connection()
+
+
+def _read_body(res):
+    data = res.read()
+    if res.getheader('Content-Encoding') == 'gzip':
+        data = gzip.decompress(data)
+    return data
+
+
+def _iter_text(res, chunk_size=CHUNK_SIZE):
+    decompressor = None
+    if res.getheader('Content-Encoding') == 'gzip':
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        data = res.read(chunk_size)
+        if not data:
+            break
+        if decompressor is not None:
+            data = decompressor.decompress(data)
+        yield decoder.decode(data)
+    if decompressor is not None:
+        yield decoder.decode(decompressor.flush(), final=True)
+
+
+def _iter_json_array(chunks, key):
+    """
+    Yield the items of the array of the first "<key>": [...] in the JSON
+    text given as chunks. The buffer is trimmed after every item, so that
+    it holds at most one item and a chunk.
+    """
+    decoder = json.JSONDecoder()
+    pattern = re.compile(r'"{}"\s*:\s*\['.format(re.escape(key)))
+    buf, pos = '', None
+    for chunk in chunks:
+        buf += chunk
+        if (m := pattern.search(buf)) is not None:
+            pos = m.end()
+            break
+        # keep the tail that can be the beginning of the key.
+        buf = buf[-(len(key) + 64):]
+    if pos is None:
+        return
+
+    chunks = iter(chunks)
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buf) and buf[pos] == ']':
+            # drain the rest of the body to reuse the connection.
+            for _ in chunks:
+                pass
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # read at least as much as the buffered part of the item to
+            # keep the number of the re-decoding of a large item small.
+            more, size = [], 0
+            for chunk in chunks:
+                more.append(chunk)
+                size += len(chunk)
+                if size >= len(buf) - pos:
+                    break
+            if not more:
+                raise
+            buf = buf[pos:] + ''.join(more)
+            pos = 0
+            continue
+        yield item
+        buf, pos = buf[end:], 0
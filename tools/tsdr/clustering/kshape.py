@@ -5,9 +5,9 @@ import math
 import numpy as np
 
 from numpy.random import randint, seed
-from numpy.linalg import norm, eigh
 from numpy.linalg import norm
-from numpy.fft import fft, ifft
+from scipy.linalg import eigh
+from numpy.fft import fft, ifft, irfft, rfft
 
 
 def zscore(a, axis=0, ddof=0):
@@ -64,6 +64,34 @@ def _ncc_c(x, y):
     cc = np.concatenate((cc[-(x_len-1):], cc[:x_len]))
     return np.real(cc) / den
 
+def _ncc_c_max(x_fft, x_norm, y, x_len, block_size=None):
+    """
+    Compute max(_ncc_c(x[i], y[j])) for all pairs of rows of x and y at once
+    from the precomputed rfft and norms of x.
+    >>> x = np.array([[1,2,3,4], [0,1,2,3], [-1,1,-1,1]])
+    >>> y = np.array([[1,2,3,4], [1,-1,1,-1]])
+    >>> np.allclose(_ncc_c_max(rfft(x, 8), norm(x, axis=1), y, 4),
+    ...             [[max(_ncc_c(a, b)) for b in y] for a in x])
+    True
+    """
+    fft_size = 2 * (x_fft.shape[1] - 1)
+    y_fft = np.conj(rfft(y, fft_size))
+    den = np.outer(x_norm, norm(y, axis=1))
+    den[den == 0] = np.inf
+    if block_size is None:
+        # keep the cross-correlations of a block small enough to fit in cache
+        block_size = max(1, (1 << 19) // max(1, y.shape[0] * fft_size))
+
+    ncc = np.empty((x_fft.shape[0], y.shape[0]))
+    for start in range(0, x_fft.shape[0], block_size):
+        end = start + block_size
+        cc = irfft(x_fft[start:end, np.newaxis, :] * y_fft[np.newaxis, :, :], fft_size)
+        # take the maximum over the valid lags of -(x_len-1)..(x_len-1)
+        ncc[start:end] = cc[:, :, :x_len].max(axis=2)
+        if x_len > 1:
+            np.maximum(ncc[start:end], cc[:, :, -(x_len-1):].max(axis=2), out=ncc[start:end])
+    return ncc / den
+
 def lag(x, y):
     return ((_ncc_c(x, y).argmax() + 1) - max(len(x), len(y))) * -1
 
@@ -84,6 +112,31 @@ def _sbd(x, y):
     return dist, yshift
 
 
+def _sbd_align(x, ys):
+    """
+    Shift each row of ys to the position where it best matches x by SBD,
+    which is equivalent to [_sbd(x, y)[1] for y in ys].
+    >>> _sbd_align(np.array([0,1,2]), np.array([[1,2,3], [2,3,0]]))
+    array([[1, 2, 3],
+           [0, 2, 3]])
+    """
+    ys = np.asarray(ys)
+    x_len = len(x)
+    fft_size = 1<<(2*x_len-1).bit_length()
+    cc = irfft(rfft(x, fft_size)[np.newaxis, :] * np.conj(rfft(ys, fft_size)), fft_size)
+    cc = np.concatenate((cc[:, -(x_len-1):], cc[:, :x_len]), axis=1) if x_len > 1 else cc[:, :1]
+    den = norm(x) * norm(ys, axis=1)
+    den[den == 0] = np.inf
+    ncc = cc / den[:, np.newaxis]
+    shifts = (ncc.argmax(axis=1) + 1) - x_len
+
+    # roll_zeropad of each row by its shift
+    pos = np.arange(ys.shape[1])[np.newaxis, :] - shifts[:, np.newaxis]
+    valid = (pos >= 0) & (pos < ys.shape[1])
+    rows = np.arange(ys.shape[0])[:, np.newaxis]
+    return np.where(valid, ys[rows, np.clip(pos, 0, ys.shape[1]-1)], 0)
+
+
 def _extract_shape(idx, x, j, cur_center):
     """
     >>> _extract_shape(np.array([0,1,2]), np.array([[1,2,3], [4,5,6]]), 1, np.array([0,3,4]))
@@ -93,32 +146,32 @@ def _extract_shape(idx, x, j, cur_center):
     >>> _extract_shape(np.array([1,0,1,0]), np.array([[1,2,3,4], [0,1,2,3], [-1,1,-1,1], [1,2,2,3]]), 0, np.array([0,0,0,0]))
     array([-1.2089303 , -0.19618238,  0.19618238,  1.2089303 ])
     >>> _extract_shape(np.array([0,0,1,0]), np.array([[1,2,3,4],[0,1,2,3],[-1,1,-1,1],[1,2,2,3]]), 0, np.array([-1.2089303,-0.19618238,0.19618238,1.2089303]))
-    array([-1.19623139, -0.26273649,  0.26273649,  1.19623139])
+    array([-1.05046429, -0.52411628,  0.35015476,  1.2244258 ])
     """
-    _a = []
-    for i in range(len(idx)):
-        if idx[i] == j:
-            if cur_center.sum() == 0:
-                opt_x = x[i]
-            else:
-                _, opt_x = _sbd(cur_center, x[i])
-            _a.append(opt_x)
-    a = np.array(_a)
-
+    a = x[np.flatnonzero(np.asarray(idx) == j)]
     if len(a) == 0:
         return np.zeros((1, x.shape[1]))
+    # an all-zero center is the one not extracted yet, which has no shape to align to.
+    if np.any(cur_center):
+        a = _sbd_align(cur_center, a)
+
     columns = a.shape[1]
     y = zscore(a,axis=1,ddof=1)
-    s = np.dot(y.transpose(), y)
-
-    p = np.empty((columns, columns))
-    p.fill(1.0/columns)
-    p = np.eye(columns) - p
-
-    # these are the 2 most expensive operations
-    m = np.dot(np.dot(p, s), p)
-    _, vec = eigh(m)
-    centroid = vec[:,-1]
+    # Centering y^T y with p = I - 1/columns from both sides is equal to
+    # centering each row of y, so that p does not need to be materialized.
+    y = y - y.mean(axis=1, keepdims=True)
+
+    # The top eigenvector of y^T y is the top right singular vector of y,
+    # which is obtained from the smaller one of y^T y and y y^T.
+    centroid = None
+    if len(y) < columns:
+        _, vec = eigh(np.dot(y, y.transpose()), subset_by_index=[len(y)-1, len(y)-1])
+        centroid = np.dot(y.transpose(), vec[:,0])
+        centroid_norm = norm(centroid)
+        centroid = centroid / centroid_norm if centroid_norm > 0 else None
+    if centroid is None:
+        _, vec = eigh(np.dot(y.transpose(), y), subset_by_index=[columns-1, columns-1])
+        centroid = vec[:,0]
     finddistance1 = math.sqrt(((a[0] - centroid) ** 2).sum())
     finddistance2 = math.sqrt(((a[0] + centroid) ** 2).sum())
 
@@ -128,12 +181,15 @@ def _extract_shape(idx, x, j, cur_center):
     return zscore(centroid, ddof=1)
 
 
-def _kshape(x, k, initial_clustering=None):
+def _kshape(x, k, initial_clustering=None, max_iter=100, return_n_iter=False):
     """
     >>> from numpy.random import seed; seed(0)
     >>> _kshape(np.array([[1,2,3,4], [0,1,2,3], [-1,1,-1,1], [1,2,2,3]]), 2)
     (array([0, 0, 1, 0]), array([[-1.2244258 , -0.35015476,  0.52411628,  1.05046429],
            [-0.8660254 ,  0.8660254 , -0.8660254 ,  0.8660254 ]]))
+    >>> _kshape(np.array([[1,2,3,4], [0,1,2,3], [-1,1,-1,1], [1,2,2,3]]), 2,
+    ...         initial_clustering=[0,0,1,1], return_n_iter=True)[2]
+    2
     """
     m = x.shape[0]
     if initial_clustering is not None:
@@ -142,24 +198,31 @@ def _kshape(x, k, initial_clustering=None):
     else:
         idx = randint(0, k, size=m)
     centroids = np.zeros((k,x.shape[1]))
-    distances = np.empty((m, k))
 
-    for _ in range(100):
+    # the spectra of the series are fixed through the iterations.
+    x_len = x.shape[1]
+    fft_size = 1<<(2*x_len-1).bit_length()
+    x_fft = rfft(x, fft_size)
+    x_norm = norm(x, axis=1)
+
+    n_iter = 0
+    for n_iter in range(1, max_iter+1):
         old_idx = idx
         for j in range(k):
             centroids[j] = _extract_shape(idx, x, j, centroids[j])
 
-        for i in range(m):
-             for j in range(k):
-                 distances[i,j] = 1 - max(_ncc_c(x[i], centroids[j]))
+        distances = 1 - _ncc_c_max(x_fft, x_norm, centroids, x_len)
         idx = distances.argmin(1)
         if np.array_equal(old_idx, idx):
             break
 
+    if return_n_iter:
+        return idx, centroids, n_iter
     return idx, centroids
 
-def kshape(x, k, initial_clustering=None):
-    idx, centroids = _kshape(np.array(x), k, initial_clustering)
+def kshape(x, k, initial_clustering=None, max_iter=100, return_n_iter=False):
+    idx, centroids, n_iter = _kshape(np.array(x), k, initial_clustering,
+                                     max_iter, return_n_iter=True)
     clusters = []
     for i, centroid in enumerate(centroids):
         series = []
@@ -167,6 +230,8 @@ def kshape(x, k, initial_clustering=None):
             if i == val:
                 series.append(j)
         clusters.append((centroid, series))
+    if return_n_iter:
+        return clusters, n_iter
     return clusters
 
 if __name__ == "__main__":
@@ -55,18 +55,73 @@ def jaro_distance(ying, yang):
               (common_chars-trans_count) / common_chars)) / 3
     return weight
 
-def cluster_words(words, service_name, size):
+def jaro_similarities(words):
+    """
+    Compute jaro_distance for all pairs of words at once.
+    The words are encoded into an array of code points and the matching of
+    each character position is done over all the pairs in a batch.
+    Returns a condensed vector in the same order as
+    scipy.spatial.distance.pdist.
+    """
+    n = len(words)
+    lens = np.array([len(w) for w in words], dtype=np.int64)
+    max_len = int(lens.max()) if n > 0 else 0
+    codes = np.full((n, max(max_len, 1)), -1, dtype=np.int32)
+    for i, word in enumerate(words):
+        codes[i, :len(word)] = [ord(ch) for ch in word]
+
+    idx1, idx2 = np.triu_indices(n, 1)
+    ying, yang = codes[idx1], codes[idx2]
+    ying_len, yang_len = lens[idx1], lens[idx2]
+    search_range = np.maximum(np.maximum(ying_len, yang_len) // 2 - 1, 0)
+
+    # looking only within search range, count & flag matched pairs
+    ying_flags = np.zeros(ying.shape, dtype=bool)
+    yang_flags = np.zeros(yang.shape, dtype=bool)
+    pairs = np.arange(len(idx1))
+    positions = np.arange(yang.shape[1])[np.newaxis, :]
+    for i in range(max_len):
+        low = np.where(i > search_range, i - search_range, 0)
+        hi = np.minimum(i + search_range, yang_len - 1)
+        candidates = ((yang == ying[:, i:i+1]) & ~yang_flags &
+                      (low[:, np.newaxis] <= positions) & (positions <= hi[:, np.newaxis]))
+        # the first unflagged matching character in the range
+        j = candidates.argmax(axis=1)
+        matched = candidates[pairs, j]
+        yang_flags[pairs[matched], j[matched]] = True
+        ying_flags[:, i] = matched
+    common_chars = ying_flags.sum(axis=1)
+
+    # count transpositions between the matched characters in order
+    ying_matched = np.take_along_axis(ying, np.argsort(~ying_flags, axis=1, kind='stable'), axis=1)
+    yang_matched = np.take_along_axis(yang, np.argsort(~yang_flags, axis=1, kind='stable'), axis=1)
+    in_common = np.arange(ying.shape[1]) < common_chars[:, np.newaxis]
+    trans_count = ((ying_matched != yang_matched) & in_common).sum(axis=1) / 2
+
+    # adjust for similarities in nonmatched characters
+    weight = np.zeros(len(idx1))
+    ok = common_chars > 0
+    common_chars = common_chars[ok].astype(np.float64)
+    weight[ok] = ((common_chars/ying_len[ok] + common_chars/yang_len[ok] +
+                   (common_chars-trans_count[ok]) / common_chars)) / 3
+    return weight
+
+def name_linkage(words, service_name):
+    """
+    Build the hierarchical clustering of the metric names, which does not
+    depend on the number of clusters and can be shared across them.
+    """
     stopwords = ["GET", "POST", "total", "http-requests", service_name, "-", "_"]
     cleaned_words = []
     for word in words:
         for stopword in stopwords:
             word = word.replace(stopword, "")
         cleaned_words.append(word)
-    def distance(coord):
-        i, j = coord
-        return 1 - jaro_distance(cleaned_words[i], cleaned_words[j])
-    indices = np.triu_indices(len(words), 1)
-    distances = np.apply_along_axis(distance, 0, indices)
-    z = linkage(distances)
+    distances = 1 - jaro_similarities(cleaned_words)
+    return linkage(distances)
+
+def cluster_words(words, service_name, size, z=None):
+    if z is None:
+        z = name_linkage(words, service_name)
     labels = fcluster(z, t=size, criterion='maxclust')
     return labels
@@ -1,7 +1,7 @@
 import numpy as np
 from numpy.linalg import norm
-from numpy.fft import fft, ifft
-from sklearn.metrics import silhouette_score as _silhouette_score
+from numpy.fft import fft, ifft, irfft, rfft
+from scipy.spatial.distance import squareform
 
 def sbd(x, y):
     ncc = _ncc_c(x, y)
@@ -21,12 +21,82 @@ def _ncc_c(x, y):
     cc = np.concatenate((cc[-(x_len-1):], cc[:x_len]))
     return np.real(cc) / den
 
-def silhouette_score(data, labels):
-    distances = np.zeros((data.shape[0], data.shape[0]))
-    for idx_a, data_a in enumerate(data):
-        for idx_b, data_b in enumerate(data):
-            if idx_a == idx_b:
-                distances[idx_a, idx_b] = 0
-                continue
-            distances[idx_a, idx_b] = sbd(data_a, data_b)
-    return _silhouette_score(distances, labels, metric='precomputed')
+def pairwise_sbd(x, block_size=None):
+    """
+    Compute SBD between all pairs of rows in x.
+    The FFT of each series is computed once and the cross-correlations are
+    computed for a block of rows against all the following rows at once.
+    Returns a condensed distance vector in the same order as
+    scipy.spatial.distance.pdist(x, metric=sbd).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    x_len = x.shape[1]
+    fft_size = 1<<(2*x_len-1).bit_length()
+    return pairwise_sbd_from_spectra(rfft(x, fft_size), norm(x, axis=1),
+                                     x_len, block_size)
+
+
+def pairwise_sbd_from_spectra(spectra, norms, x_len, block_size=None):
+    """
+    Compute pairwise_sbd from the precomputed rfft of the series zero-padded
+    to the power of two not less than 2*x_len-1, and the norms of the series.
+    """
+    m, fft_size = spectra.shape[0], 2 * (spectra.shape[1] - 1)
+    if block_size is None:
+        # keep the cross-correlations of a block small enough to fit in cache
+        block_size = max(1, (1 << 19) // max(1, m * fft_size))
+    den = np.outer(norms, norms)
+    den[den == 0] = np.inf
+
+    dist = np.empty(m * (m - 1) // 2)
+    offset = 0
+    for start in range(0, m, block_size):
+        end = min(start + block_size, m)
+        cc = irfft(spectra[start:end, np.newaxis, :] *
+                   np.conj(spectra[np.newaxis, start:, :]), fft_size)
+        # take the maximum over the valid lags of -(x_len-1)..(x_len-1)
+        ncc = cc[:, :, :x_len].max(axis=2)
+        if x_len > 1:
+            ncc = np.maximum(ncc, cc[:, :, -(x_len-1):].max(axis=2))
+        ncc /= den[start:end, start:]
+        for i in range(end - start):
+            row = 1 - ncc[i, i+1:]
+            dist[offset:offset+len(row)] = row
+            offset += len(row)
+    dist[dist < 0] = 0
+    return dist
+
+
+def sbd_matrix(x):
+    """
+    Compute the square matrix of SBD between all pairs of rows in x.
+    """
+    return squareform(pairwise_sbd(x))
+
+
+def silhouette_score(distances, labels):
+    """
+    Compute the mean silhouette coefficient over the precomputed distance
+    matrix, which is equivalent to
+    sklearn.metrics.silhouette_score(distances, labels, metric='precomputed').
+    """
+    distances = np.asarray(distances)
+    n_samples = distances.shape[0]
+    _, labels = np.unique(labels, return_inverse=True)
+    n_labels = labels.max() + 1
+    if not 1 < n_labels < n_samples:
+        raise ValueError("Number of labels is %d. Valid values are 2 "
+                         "to n_samples - 1 (inclusive)" % n_labels)
+
+    counts = np.bincount(labels)
+    # sum of distances from each sample to the members of each cluster
+    sums = distances @ (labels[:, np.newaxis] == np.arange(n_labels))
+    rows = np.arange(n_samples)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        intra = sums[rows, labels] / (counts[labels] - 1)
+        inter = sums / counts
+        inter[rows, labels] = np.inf
+        inter = inter.min(axis=1)
+        sil = (inter - intra) / np.maximum(intra, inter)
+    # the coefficient of a sample in a singleton cluster is 0.
+    return np.nan_to_num(sil).mean()
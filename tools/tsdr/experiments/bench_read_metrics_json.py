@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+CUR_DIR = os.fspath(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(CUR_DIR, '..'))
+sys.path.append(os.path.join(CUR_DIR, '..', '..', 'metrics'))
+
+import columnar  # noqa: E402
+import tsdr  # noqa: E402
+
+STEP = 15
+POINT_NUM = 361
+SERIES_NUMS = [1000, 5000, 20000]
+
+
+def log(msg):
+    print(msg, file=sys.stderr)
+
+
+def legacy_read_metrics_json(data_file):
+    """ The former implementation of tsdr.read_metrics_json for comparison. """
+    with open(data_file) as f:
+        raw_json = json.load(f)
+    raw_data = pd.read_json(data_file)
+    data_df = pd.DataFrame()
+    # suppress PerformanceWarning of the fragmented DataFrame.
+    warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+    for target in tsdr.TARGET_DATA:
+        for t in raw_data[target].dropna():
+            for metric in t:
+                if metric["metric_name"] not in tsdr.TARGET_DATA[target] and tsdr.TARGET_DATA[target] != "all":
+                    continue
+                metric_name = metric["metric_name"].replace("container_", "").replace("node_", "")
+                target_name = metric[
+                    "{}_name".format(target[:-1]) if target != "middlewares" else "container_name"
+                ]
+                if target_name in ["queue-master", "rabbitmq", "session-db"]:
+                    continue
+                target_name = re.sub(';node-exporter$', '', target_name)
+                column_name = "{}-{}_{}".format(target[0], target_name, metric_name)
+                data_df[column_name] = np.array(metric["values"], dtype=np.float64)[:, 1][-tsdr.PLOTS_NUM:]
+    data_df = data_df.round(4)
+    data_df = data_df.interpolate(method="spline", order=3, limit_direction="both")
+    return data_df, raw_json['mappings'], raw_json['meta']
+
+
+def generate_metrics_json(path, series_num, seed=0):
+    rng = np.random.default_rng(seed)
+    start = 1600000000
+    timestamps = [start + STEP * i for i in range(POINT_NUM)]
+    targets = {
+        'containers': ('container_name', 'container_metric_{}'),
+        'middlewares': ('container_name', 'middleware_metric_{}'),
+        'services': ('service_name', 'metric_{}'),
+        'nodes': ('node_name', 'node_metric_{}'),
+    }
+    data = {target: {} for target in targets}
+    for i in range(series_num):
+        target = list(targets)[i % len(targets)]
+        label, metric_fmt = targets[target]
+        component = "{}-{}".format(target[:-1], i % 20)
+        values = rng.random(POINT_NUM)
+        data[target].setdefault(component, []).append({
+            label: component,
+            'metric_name': metric_fmt.format(i),
+            'values': [[ts, str(v)] for ts, v in zip(timestamps, values)],
+        })
+    data['mappings'] = {'nodes-containers': {}}
+    data['meta'] = {'start': timestamps[0], 'end': timestamps[-1], 'step': STEP}
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def measure(func, path, num_test):
+    elapsed = []
+    for _ in range(num_test):
+        start = time.time()
+        data_df, _, _ = func(path)
+        elapsed.append(time.time() - start)
+    return min(elapsed), data_df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series-nums", help="numbers of series",
+                        type=int, nargs='+', default=SERIES_NUMS)
+    parser.add_argument("--num-test", help="number of test", type=int, default=3)
+    parser.add_argument("--skip-legacy", help="skip the former implementation",
+                        action='store_true')
+    args = parser.parse_args()
+
+    output = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for series_num in args.series_nums:
+            path = os.path.join(tmpdir, "metrics_{}.json".format(series_num))
+            log(f"Generating {path} ...")
+            generate_metrics_json(path, series_num)
+
+            log(f"Running read_metrics_json in case of {series_num} series ...")
+            new_time, new_df = measure(tsdr.read_metrics_json, path, args.num_test)
+            output[series_num] = {'read_metrics_json': round(new_time, 3)}
+
+            col_path = os.path.join(tmpdir, "metrics_{}.col".format(series_num))
+            with open(path) as f, open(col_path, 'wb') as col_f:
+                columnar.dump(json.load(f), col_f)
+            log(f"Running read_metrics_file of columnar format in case of {series_num} series ...")
+            col_time, col_df = measure(tsdr.read_metrics_file, col_path, args.num_test)
+            pd.testing.assert_frame_equal(new_df, col_df)
+            output[series_num]['read_metrics_columnar'] = round(col_time, 3)
+            output[series_num]['file_size'] = {
+                'json': os.path.getsize(path), 'columnar': os.path.getsize(col_path)}
+            if args.skip_legacy:
+                continue
+
+            log(f"Running legacy read_metrics_json in case of {series_num} series ...")
+            old_time, old_df = measure(legacy_read_metrics_json, path, args.num_test)
+            pd.testing.assert_frame_equal(old_df, new_df)
+            output[series_num]['legacy_read_metrics_json'] = round(old_time, 3)
+            output[series_num]['speedup'] = round(old_time / new_time, 1)
+
+    json.dump(output, sys.stdout, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+""" Check that _kshape assigns the same labels as the original k-Shape
+
+    The reference below is the original per-series implementation of
+    _extract_shape and _kshape, except that an uninitialized center is
+    detected by not np.any(cur_center) instead of cur_center.sum() == 0,
+    which flips on the rounding of a z-normalized center.
+"""
+
+import os
+import sys
+
+import numpy as np
+from numpy.linalg import eigh
+
+CUR_DIR = os.fspath(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(CUR_DIR, '..'))
+
+from clustering import kshape  # noqa: E402
+
+TRIALS = 200
+
+
+def reference_extract_shape(idx, x, j, cur_center):
+    _a = []
+    for i in range(len(idx)):
+        if idx[i] == j:
+            if not np.any(cur_center):
+                opt_x = x[i]
+            else:
+                _, opt_x = kshape._sbd(cur_center, x[i])
+            _a.append(opt_x)
+    a = np.array(_a)
+
+    if len(a) == 0:
+        return np.zeros((1, x.shape[1]))
+    columns = a.shape[1]
+    y = kshape.zscore(a, axis=1, ddof=1)
+    s = np.dot(y.transpose(), y)
+
+    p = np.empty((columns, columns))
+    p.fill(1.0 / columns)
+    p = np.eye(columns) - p
+
+    m = np.dot(np.dot(p, s), p)
+    _, vec = eigh(m)
+    centroid = vec[:, -1]
+    finddistance1 = np.sqrt(((a[0] - centroid) ** 2).sum())
+    finddistance2 = np.sqrt(((a[0] + centroid) ** 2).sum())
+
+    if finddistance1 >= finddistance2:
+        centroid *= -1
+
+    return kshape.zscore(centroid, ddof=1)
+
+
+def reference_kshape(x, k):
+    m = x.shape[0]
+    idx = np.random.randint(0, k, size=m)
+    centroids = np.zeros((k, x.shape[1]))
+    distances = np.empty((m, k))
+
+    for _ in range(100):
+        old_idx = idx
+        for j in range(k):
+            centroids[j] = reference_extract_shape(idx, x, j, centroids[j])
+
+        for i in range(m):
+            for j in range(k):
+                distances[i, j] = 1 - max(kshape._ncc_c(x[i], centroids[j]))
+
+        idx = distances.argmin(1)
+        if np.array_equal(old_idx, idx):
+            break
+
+    return idx, centroids
+
+
+def random_series(rng):
+    m, n, k = int(rng.integers(5, 60)), int(rng.integers(8, 120)), int(rng.integers(2, 7))
+    t = np.arange(n)
+    protos = [np.sin(t / (3 + i)) for i in range(k)]
+    x = np.array([protos[i % k] * rng.uniform(0.5, 2) + rng.normal(0, 0.5, n) for i in range(m)])
+    return kshape.zscore(x, axis=1), k
+
+
+def test_kshape_labels_equal_reference():
+    for trial in range(TRIALS):
+        x, k = random_series(np.random.default_rng(trial))
+        np.random.seed(trial)
+        labels, _ = kshape._kshape(x, k)
+        np.random.seed(trial)
+        expected, _ = reference_kshape(x, k)
+        assert np.array_equal(labels, expected), "labels differ in trial {}".format(trial)
+
+
+def test_kshape_zero_iterations():
+    x, k = random_series(np.random.default_rng(0))
+    idx, centroids, n_iter = kshape._kshape(x, k, initial_clustering=[0] * len(x),
+                                            max_iter=0, return_n_iter=True)
+    assert n_iter == 0 and not np.any(centroids)
+
+
+if __name__ == '__main__':
+    test_kshape_labels_equal_reference()
+    test_kshape_zero_iterations()
+    print("ok")
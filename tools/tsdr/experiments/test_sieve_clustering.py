@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+""" Check that the k sweep of sieve with patience is independent of the pool size """
+
+import os
+import sys
+from concurrent import futures
+
+import numpy as np
+import pandas as pd
+
+CUR_DIR = os.fspath(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(CUR_DIR, '..'))
+
+import tsdr  # noqa: E402
+
+SERVICES = ['carts', 'orders', 'user', 'payment']
+TRIALS = 5
+
+
+def random_metrics(rng, rows=60, metrics_num=12):
+    """ Noisy sine waves of a few periods per service. """
+    t = np.arange(rows)
+    columns, data = [], []
+    for ser in SERVICES:
+        for i in range(metrics_num):
+            data.append(100 + np.sin(t / (2 + i % 3)) * rng.uniform(1, 5) + rng.normal(0, 0.5, rows))
+            columns.append("c-{}_metric{}".format(ser, i))
+    return pd.DataFrame(np.array(data).T, columns=columns)
+
+
+def run_sieve_clustering(data_df, max_workers, patience):
+    """
+    Return the number of the reduced metrics and the clusters as sets, since
+    a cluster of two has a random representative.
+    """
+    with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        reduced_df, clustering_info, _ = tsdr.sieve_clustering(data_df, SERVICES, executor, patience)
+    return len(reduced_df.columns), {frozenset([rep] + members) for rep, members in clustering_info.items()}
+
+
+def test_patience_sweep_on_multi_worker_pool():
+    for trial in range(TRIALS):
+        data_df = random_metrics(np.random.default_rng(trial))
+        expected = run_sieve_clustering(data_df, 1, patience=1)
+        assert run_sieve_clustering(data_df, 4, patience=1) == expected, "trial {}".format(trial)
+
+
+if __name__ == '__main__':
+    test_patience_sweep_on_multi_worker_pool()
+    print("ok")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+""" Check that StreamingTSDR matches a batch reduction of every window """
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+CUR_DIR = os.fspath(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(CUR_DIR, '..'))
+
+import tsdr  # noqa: E402
+from clustering.sbd import pairwise_sbd  # noqa: E402
+from streaming import StreamingTSDR  # noqa: E402
+
+WINDOW_SIZE = 30
+UPDATES = 60
+SERVICES = ['carts', 'orders']
+
+
+def random_metrics(rng, rows):
+    """ Random walks, a half of which follow a shared walk per service. """
+    columns, data = [], []
+    for ser in SERVICES:
+        base = np.cumsum(rng.normal(size=rows))
+        for i in range(6):
+            walk = np.cumsum(rng.normal(size=rows))
+            data.append(100 + (base + 0.3 * walk if i % 2 else walk))
+            columns.append("c-{}_metric{}".format(ser, i))
+    return pd.DataFrame(np.array(data).T, columns=columns)
+
+
+def partition(clustering_info):
+    """ The clusters as sets, since a cluster of two has a random representative. """
+    return {frozenset([rep] + members) for rep, members in clustering_info.items()}
+
+
+def batch_reduce(window_df):
+    reduced_df = tsdr.reduce_series_with_cv(window_df)
+    clustering_info = {}
+    for ser in SERVICES:
+        target_df = reduced_df.loc[:, reduced_df.columns.str.startswith(tsdr.service_metrics_prefix(ser))]
+        if len(target_df.columns) < 2:
+            continue
+        c_info, remove_list = tsdr.hierarchical_clustering(target_df, pairwise_sbd)
+        clustering_info.update(c_info)
+        reduced_df = reduced_df.drop(remove_list, axis=1)
+    return list(reduced_df.columns), clustering_info
+
+
+def test_update_with_missing_samples():
+    data_df = random_metrics(np.random.default_rng(0), WINDOW_SIZE + UPDATES)
+    stream = StreamingTSDR(data_df.iloc[:WINDOW_SIZE], SERVICES, window_size=WINDOW_SIZE)
+    for t in range(WINDOW_SIZE, WINDOW_SIZE + UPDATES):
+        samples = data_df.iloc[t].to_dict()
+        if t % 3 == 0 or t >= WINDOW_SIZE + UPDATES // 2:
+            # all the samples of a service are lacking at this tick,
+            # and at every tick of the latter half.
+            for col in samples:
+                if col.startswith(tsdr.service_metrics_prefix('carts')):
+                    samples[col] = np.nan
+        reduced_metrics, clustering_info = stream.update(samples)
+
+        window_df = pd.DataFrame(stream.window(), columns=stream.columns)
+        expected_metrics, expected_info = batch_reduce(window_df)
+        assert len(reduced_metrics) == len(expected_metrics), "tick {}".format(t)
+        assert partition(clustering_info) == partition(expected_info), "tick {}".format(t)
+
+
+if __name__ == '__main__':
+    test_update_with_missing_samples()
+    print("ok")
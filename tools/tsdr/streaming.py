@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+""" Streaming mode of tsdr
+
+StreamingTSDR keeps a sliding window of PLOTS_NUM points per series and
+accepts new samples one timestamp at a time. The sums for mean/std and the
+FFT of each window are updated incrementally, so that the reduction is
+re-run without recomputing everything from scratch:
+
+- step1: the coefficient-of-variation filter of sieve over running sums.
+- step2: the hierarchical clustering by SBD of tsifter over cached FFTs.
+  Every service is reclustered on each update, since sliding the window
+  changes the SBD even between series with no new sample.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from numpy.fft import rfft
+
+import tsdr
+from clustering.sbd import pairwise_sbd_from_spectra
+
+# recompute sums and FFTs from the window every this number of updates
+# to cancel the accumulated rounding errors of the incremental updates.
+REFRESH_INTERVAL = tsdr.PLOTS_NUM
+
+
+class StreamingTSDR:
+    def __init__(self, data_df, services_list, window_size=tsdr.PLOTS_NUM,
+                 refresh_interval=REFRESH_INTERVAL):
+        if len(data_df) < window_size:
+            raise ValueError("data_df must have at least {} rows".format(window_size))
+        self.columns = list(data_df.columns)
+        self.window_size = window_size
+        self.refresh_interval = refresh_interval
+        self.fft_size = 1<<(2*window_size-1).bit_length()
+
+        # the window is kept as a ring buffer, self._pos points the oldest row.
+        self._window = np.array(data_df.values[-window_size:], dtype=np.float64)
+        self._pos = 0
+
+        # sliding DFT: dropping the oldest point x0 and appending x_new,
+        # W'[k] = exp(2πik/L) * (W[k] - x0) + x_new * exp(-2πik(N-1)/L)
+        k = np.arange(self.fft_size // 2 + 1)
+        self._shift = np.exp(2j * np.pi * k / self.fft_size)
+        self._last = np.exp(-2j * np.pi * k * (window_size - 1) / self.fft_size)
+        self._ones_fft = rfft(np.ones(window_size), self.fft_size)
+        self._refresh()
+
+        self.services = {}
+        for ser in services_list:
+            idx = [i for i, col in enumerate(self.columns)
+                   if col.startswith(tsdr.service_metrics_prefix(ser))]
+            if idx:
+                self.services[ser] = np.array(idx)
+
+    def _refresh(self):
+        window = self.window()
+        self._sum = window.sum(axis=0)
+        self._sumsq = (window ** 2).sum(axis=0)
+        self._spectra = rfft(window.T, self.fft_size)
+        self._updates = 0
+
+    def window(self):
+        """ Return the current window in chronological order. """
+        return np.roll(self._window, -self._pos, axis=0)
+
+    def update(self, samples):
+        """
+        Append the samples of a new timestamp, a dict of column name to
+        value, and return the reduced metrics and the clustering info.
+        A series lacking a finite sample carries its last value forward.
+        """
+        x_old = self._window[self._pos].copy()
+        x_new = self._window[self._pos - 1].copy()
+        for i, col in enumerate(self.columns):
+            v = samples.get(col)
+            if v is not None and np.isfinite(v):
+                x_new[i] = v
+        self._window[self._pos] = x_new
+        self._pos = (self._pos + 1) % self.window_size
+
+        self._updates += 1
+        if self._updates >= self.refresh_interval:
+            self._refresh()
+        else:
+            self._sum += x_new - x_old
+            self._sumsq += x_new ** 2 - x_old ** 2
+            self._spectra = self._shift * (self._spectra - x_old[:, np.newaxis]) + \
+                x_new[:, np.newaxis] * self._last
+
+        return self.reduce()
+
+    def reduce(self):
+        n = self.window_size
+        mean = self._sum / n
+        std = np.sqrt(np.maximum(self._sumsq / n - mean ** 2, 0.))
+        # step1: the same rule as tsdr.reduce_series_with_cv
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cv = std / mean
+        cv[(mean == 0.) & (std == 0.)] = 0
+        keep = cv > 0.002
+
+        # step2: SBD is invariant to scaling, so that the spectra of
+        # z-normalized series are given by centering the cached ones.
+        clustering_info, remove_list = {}, set()
+        for idx in self.services.values():
+            members = idx[keep[idx]]
+            if len(members) < 2:
+                continue
+            spectra = self._spectra[members] - mean[members, np.newaxis] * self._ones_fft
+            dist = pairwise_sbd_from_spectra(spectra, std[members] * np.sqrt(n), n)
+            c_info, r_list = tsdr.clustering_by_distance(dist, [self.columns[i] for i in members])
+            clustering_info.update(c_info)
+            remove_list.update(r_list)
+        reduced_metrics = [col for i, col in enumerate(self.columns)
+                           if keep[i] and col not in remove_list]
+        return reduced_metrics, clustering_info
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="replay a metrics data file as a stream of samples")
+    parser.add_argument("datafile", help="metrics data file (JSON or columnar)")
+    parser.add_argument("--plot-num",
+                        help="number of plots in the sliding window",
+                        type=int, default=tsdr.PLOTS_NUM)
+    parser.add_argument("--out", help="output path", type=str)
+    args = parser.parse_args()
+
+    data_df, mappings, metrics_meta = tsdr.read_metrics_file(args.datafile, plots_num=None)
+    services = tsdr.prepare_services_list(data_df)
+
+    start = time.time()
+    stream = StreamingTSDR(data_df.iloc[:args.plot_num], services, window_size=args.plot_num)
+    reduced_metrics, clustering_info = stream.reduce()
+    init_time = time.time() - start
+
+    latencies = []
+    for _, row in data_df.iloc[args.plot_num:].iterrows():
+        start = time.time()
+        reduced_metrics, clustering_info = stream.update(row.to_dict())
+        latencies.append(time.time() - start)
+
+    summary = {
+        'data_file': args.datafile.split("/")[-1],
+        'number_of_plots': args.plot_num,
+        'number_of_updates': len(latencies),
+        'execution_time': {
+            'initialize': round(init_time, 4),
+            'update_mean': round(float(np.mean(latencies)), 4) if latencies else None,
+            'update_max': round(float(np.max(latencies)), 4) if latencies else None,
+        },
+        'metrics_dimension': {'total': [len(data_df.columns), len(reduced_metrics)]},
+        'reduced_metrics': reduced_metrics,
+        'clustering_info': clustering_info,
+        'components_mappings': mappings,
+        'metrics_meta': metrics_meta,
+    }
+    if args.out is None:
+        json.dump(summary, sys.stdout)
+    else:
+        with open(args.out, mode='w') as f:
+            json.dump(summary, f)
+
+
+if __name__ == '__main__':
+    # Disable multithreading in numpy.
+    os.environ["OMP_NUM_THREADS"] = "1"
+    os.environ["OPENBLAS_NUM_THREADS"] = "1"
+    os.environ["MKL_NUM_THREADS"] = "1"
+    main()
@@ -13,19 +13,20 @@ from datetime import datetime
 import numpy as np
 import pandas as pd
 from scipy.cluster.hierarchy import fcluster, linkage
-from scipy.spatial.distance import pdist, squareform
+from scipy.spatial.distance import squareform
 from statsmodels.tsa.stattools import adfuller
 
 from clustering.kshape import kshape
-from clustering.metricsnamecluster import cluster_words
-from clustering.sbd import sbd, silhouette_score
-from util import util
+from clustering.metricsnamecluster import cluster_words, name_linkage
+from clustering.sbd import pairwise_sbd, sbd, sbd_matrix, silhouette_score
+from util import adf, columnar, util
 
 TSIFTER_METHOD = 'tsifter'
 SIEVE_METHOD = 'sieve'
 
 PLOTS_NUM = 120
 SIGNIFICANCE_LEVEL = 0.05
+ADF_CHUNK_SIZE = 64
 THRESHOLD_DIST = 0.01
 TARGET_DATA = {"containers": "all",
                "services": "all",
@@ -34,45 +35,54 @@ TARGET_DATA = {"containers": "all",
 
 
 def reduce_series_with_cv(data_df):
-    reduced_by_cv_df = pd.DataFrame()
-    for col in data_df.columns:
-        data = data_df[col].values
-        mean = data.mean()
-        std = data.std()
-        if mean == 0. and std == 0.:
-            cv = 0
-        else:
-            cv = std / mean
-        if cv > 0.002:
-            reduced_by_cv_df[col] = data_df[col]
-    return reduced_by_cv_df
+    data = data_df.values
+    mean = data.mean(axis=0)
+    std = data.std(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cv = std / mean
+    cv[(mean == 0.) & (std == 0.)] = 0
+    return data_df.loc[:, cv > 0.002]
 
 
 def reduce_series_with_adf(data_df, max_workers):
-    reduced_by_st_df = pd.DataFrame()
     with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        future_to_col = {}
-        for col in data_df.columns:
-            data = data_df[col].values
-            if data.sum() == 0. or len(np.unique(data)) == 1 or np.isnan(data.sum()):
-                continue
-            future_to_col[executor.submit(adfuller, data)] = col
-        for future in futures.as_completed(future_to_col):
-            col = future_to_col[future]
-            p_val = future.result()[1]
-            if not np.isnan(p_val):
-                if p_val >= SIGNIFICANCE_LEVEL:
-                    reduced_by_st_df[col] = data_df[col]
+        reduced_by_st_df, _ = tsifter_reduce_series(data_df, executor)
     return reduced_by_st_df
 
 
+def adfuller_chunk(data, maxlag=None):
+    """
+    Run ADF tests over the columns of data in a worker process.
+    maxlag=None selects the lag length of each series by AIC, otherwise
+    all the series are tested with the fixed lag length in a batch.
+    """
+    start = time.time()
+    if maxlag is None:
+        p_vals = np.array([adfuller(x)[1] for x in data.T])
+    else:
+        p_vals = adf.adfuller_fixed_lag(data, maxlag)
+    return p_vals, round(time.time() - start, 4)
+
+
 def hierarchical_clustering(target_df, dist_func):
+    """
+    dist_func takes the matrix of series and returns the condensed distance
+    vector of all pairs, like clustering.sbd.pairwise_sbd.
+    """
     series = target_df.values.T
     norm_series = util.z_normalization(series)
-    dist = pdist(norm_series, metric=dist_func)
+    dist = dist_func(norm_series)
     # distance_list.extend(dist)
+    return clustering_by_distance(dist, target_df.columns)
+
+
+def clustering_by_distance(dist, columns):
+    """
+    Cluster the metrics by the condensed distance vector of all pairs and
+    select the representative metric of each cluster.
+    """
     dist_matrix = squareform(dist)
-    z = linkage(dist, method="single", metric=dist_func)
+    z = linkage(dist, method="single")
     labels = fcluster(z, t=THRESHOLD_DIST, criterion="distance")
     cluster_dict = {}
     for i, v in enumerate(labels):
@@ -88,29 +98,21 @@ def hierarchical_clustering(target_df, dist_func):
         if len(cluster_metrics) == 2:
             # Select the representative metric at random
             shuffle_list = random.sample(cluster_metrics, len(cluster_metrics))
-            clustering_info[target_df.columns[shuffle_list[0]]] = [target_df.columns[shuffle_list[1]]]
-            remove_list.append(target_df.columns[shuffle_list[1]])
+            clustering_info[columns[shuffle_list[0]]] = [columns[shuffle_list[1]]]
+            remove_list.append(columns[shuffle_list[1]])
         elif len(cluster_metrics) > 2:
             # Select medoid as the representative metric
-            distances = []
-            for met1 in cluster_metrics:
-                dist_sum = 0
-                for met2 in cluster_metrics:
-                    if met1 != met2:
-                        dist_sum += dist_matrix[met1][met2]
-                distances.append(dist_sum)
+            distances = dist_matrix[np.ix_(cluster_metrics, cluster_metrics)].sum(axis=1)
             medoid = cluster_metrics[np.argmin(distances)]
-            clustering_info[target_df.columns[medoid]] = []
+            clustering_info[columns[medoid]] = []
             for r in cluster_metrics:
                 if r != medoid:
-                    remove_list.append(target_df.columns[r])
-                    clustering_info[target_df.columns[medoid]].append(target_df.columns[r])
+                    remove_list.append(columns[r])
+                    clustering_info[columns[medoid]].append(columns[r])
     return clustering_info, remove_list
 
 
-def create_clusters(data, columns, service_name, n):
-    words_list = [col[2:] for col in columns]
-    init_labels = cluster_words(words_list, service_name, n)
+def create_clusters(data, dist_matrix, init_labels, n):
     results = kshape(data, n, initial_clustering=init_labels)
     label = [0] * data.shape[0]
     cluster_center = []
@@ -124,7 +126,7 @@ def create_clusters(data, columns, service_name, n):
         cluster_num += 1
     if len(set(label)) == 1:
         return None
-    return (label, silhouette_score(data, label), cluster_center)
+    return (label, silhouette_score(dist_matrix, label), cluster_center)
 
 
 def select_representative_metric(data, cluster_metrics, columns, centroid):
@@ -152,27 +154,30 @@ def select_representative_metric(data, cluster_metrics, columns, centroid):
     return (clustering_info, remove_list)
 
 
-def kshape_clustering(target_df, service_name, executor):
-    future_list = []
-
-    data = util.z_normalization(target_df.values.T)
-    for n in np.arange(2, data.shape[0]):
-        future_list.append(
-            executor.submit(create_clusters, data,
-                            target_df.columns, service_name, n)
-        )
-    labels, scores, centroids = [], [], []
-    for future in futures.as_completed(future_list):
-        cluster = future.result()
-        if cluster is None:
-            continue
-        labels.append(cluster[0])
-        scores.append(cluster[1])
-        centroids.append(cluster[2])
-
-    idx = np.argmax(scores)
-    label = labels[idx]
-    centroid = centroids[idx]
+def advance_k_sweep(sweep, patience=None):
+    """
+    Scan the results of the k sweep of a service in ascending order of k as
+    far as they are available, and keep the k with the best silhouette score.
+    Returns True when the sweep is complete, or when the score has not been
+    improved for patience consecutive k.
+    """
+    results = sweep['results']
+    while sweep['next_k'] in results:
+        k = sweep['next_k']
+        sweep['next_k'] += 1
+        cluster = results[k]
+        if cluster is not None:
+            best_k = sweep['best_k']
+            if best_k is None or cluster[1] > results[best_k][1]:
+                sweep['best_k'] = k
+        if patience is not None and sweep['best_k'] is not None \
+                and k - sweep['best_k'] >= patience:
+            return True
+    return sweep['next_k'] >= sweep['max_k']
+
+
+def submit_representative_metrics(sweep, executor):
+    label, _, centroid = sweep['results'][sweep['best_k']]
     cluster_dict = {}
     for i, v in enumerate(label):
         if v not in cluster_dict:
@@ -183,107 +188,174 @@ def kshape_clustering(target_df, service_name, executor):
     future_list = []
     for c, cluster_metrics in cluster_dict.items():
         future_list.append(
-            executor.submit(select_representative_metric, data,
-                            cluster_metrics, target_df.columns, centroid[c])
+            executor.submit(util.run_with_shared_arrays, select_representative_metric,
+                            (sweep['data_spec'],), cluster_metrics, sweep['columns'], centroid[c])
         )
-    clustering_info = {}
-    remove_list = []
-    for future in futures.as_completed(future_list):
-        c_info, r_list = future.result()
-        if c_info is None:
-            continue
-        clustering_info.update(c_info)
-        remove_list.extend(r_list)
+    return future_list
 
-    return clustering_info, remove_list
 
+def tsifter_reduce_series(data_df, executor, chunk_size=ADF_CHUNK_SIZE, maxlag=None):
+    data = data_df.values
+    # exclude series that are zero, constant or including NaN
+    data_sum = data.sum(axis=0)
+    is_target = (data_sum != 0.) & ~(data == data[0]).all(axis=0) & ~np.isnan(data_sum)
+    target_idx = np.flatnonzero(is_target)
 
-def tsifter_reduce_series(data_df, max_workers):
-    reduced_by_st_df = pd.DataFrame()
-    with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        future_to_col = {}
-        for col in data_df.columns:
-            data = data_df[col].values
-            if data.sum() == 0. or len(np.unique(data)) == 1 or np.isnan(data.sum()):
-                continue
-            future_to_col[executor.submit(adfuller, data)] = col
-        for future in futures.as_completed(future_to_col):
-            col = future_to_col[future]
-            p_val = future.result()[1]
-            if not np.isnan(p_val):
-                if p_val >= SIGNIFICANCE_LEVEL:
-                    reduced_by_st_df[col] = data_df[col]
-    return reduced_by_st_df
+    future_to_idx = {}
+    for i in range(0, len(target_idx), chunk_size):
+        chunk_idx = target_idx[i:i+chunk_size]
+        future_to_idx[executor.submit(adfuller_chunk, data[:, chunk_idx], maxlag)] = chunk_idx
+
+    p_vals = np.full(data.shape[1], np.nan)
+    chunk_times = []
+    for future in futures.as_completed(future_to_idx):
+        chunk_idx = future_to_idx[future]
+        p_vals[chunk_idx], elapsed = future.result()
+        chunk_times.append({"series": len(chunk_idx), "time": elapsed})
+
+    # p_val is NaN for excluded series, so that comparison is False.
+    return data_df.loc[:, p_vals >= SIGNIFICANCE_LEVEL], chunk_times
 
 
 def sieve_reduce_series(data_df):
     return reduce_series_with_cv(data_df)
 
 
-def tsifter_clustering(reduced_by_st_df, services_list, max_workers):
+def service_metrics_prefix(ser):
+    # metrics of a service include services, containers and middlewares metrics
+    return ("s-{}_".format(ser), "c-{}_".format(ser), "c-{}-".format(ser), "m-{}_".format(ser), "m-{}-".format(ser))
+
+
+def tsifter_clustering(reduced_by_st_df, services_list, executor):
     clustering_info = {}
     reduced_df = reduced_by_st_df
 
-    with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        # Clustering metrics by service including services, containers and middlewares metrics
-        future_list = []
-        for ser in services_list:
-            target_df = reduced_by_st_df.loc[:, reduced_by_st_df.columns.str.startswith(
-                ("s-{}_".format(ser), "c-{}_".format(ser), "c-{}-".format(ser), "m-{}_".format(ser), "m-{}-".format(ser)))]
-            if len(target_df.columns) in [0, 1]:
-                continue
-            future_list.append(executor.submit(hierarchical_clustering, target_df, sbd))
-        for future in futures.as_completed(future_list):
-            c_info, remove_list = future.result()
-            clustering_info.update(c_info)
-            reduced_df = reduced_df.drop(remove_list, axis=1)
+    # Clustering metrics by service including services, containers and middlewares metrics
+    future_list = []
+    for ser in services_list:
+        target_df = reduced_by_st_df.loc[:, reduced_by_st_df.columns.str.startswith(
+            service_metrics_prefix(ser))]
+        if len(target_df.columns) in [0, 1]:
+            continue
+        future_list.append(executor.submit(hierarchical_clustering, target_df, pairwise_sbd))
+    for future in futures.as_completed(future_list):
+        c_info, remove_list = future.result()
+        clustering_info.update(c_info)
+        reduced_df = reduced_df.drop(remove_list, axis=1)
 
     return reduced_df, clustering_info
 
 
-def sieve_clustering(reduced_by_cv_df, services_list, max_workers):
+def sieve_clustering(reduced_by_cv_df, services_list, executor, patience=None):
     clustering_info = {}
-    reduced_df = reduced_by_cv_df
+    remove_list = []
+    service_times = {}
 
-    with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        # Clustering metrics by services including services, containers and middlewares
+    sweeps, shms = {}, []
+    future_to_service = {}
+    try:
+        # Put the data of each service into shared memory once, and fan out
+        # the (service, k) work units of all the services to the pool together.
         for ser in services_list:
             target_df = reduced_by_cv_df.loc[:, reduced_by_cv_df.columns.str.startswith(
-                ("s-{}_".format(ser), "c-{}_".format(ser), "c-{}-".format(ser), "m-{}_".format(ser), "m-{}-".format(ser)))]
+                service_metrics_prefix(ser))]
             if len(target_df.columns) in [0, 1]:
                 continue
-            c_info, remove_list = kshape_clustering(target_df, ser, executor)
-            clustering_info.update(c_info)
-            reduced_df = reduced_df.drop(remove_list, axis=1)
-    
-    return reduced_df, clustering_info
+            start = time.time()
+            data = util.z_normalization(target_df.values.T)
+            data_shm, data_spec = util.to_shared_array(data)
+            shms.append(data_shm)
+            # SBD matrix is shared by silhouette scores of all candidate k.
+            dist_shm, dist_spec = util.to_shared_array(sbd_matrix(data))
+            shms.append(dist_shm)
+            sweep = {
+                'start': start, 'data_spec': data_spec, 'columns': list(target_df.columns),
+                'max_k': data.shape[0], 'next_k': 2, 'best_k': None,
+                'results': {}, 'futures': {},
+            }
+            # The linkage of metric names is shared by initial labels of all candidate k.
+            words_list = [col[2:] for col in sweep['columns']]
+            z = name_linkage(words_list, ser)
+            for n in range(2, data.shape[0]):
+                init_labels = cluster_words(words_list, ser, n, z=z)
+                future = executor.submit(util.run_with_shared_arrays, create_clusters,
+                                         (data_spec, dist_spec), init_labels, n)
+                sweep['futures'][future] = n
+                future_to_service[future] = ser
+            sweeps[ser] = sweep
+
+        pending = set(future_to_service)
+        # the futures of select_representative_metric, apart from the ones of k.
+        representative_futures = set()
+        while pending:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                ser = future_to_service[future]
+                sweep = sweeps[ser]
+                if future in representative_futures:
+                    c_info, r_list = future.result()
+                    if c_info is not None:
+                        clustering_info.update(c_info)
+                        remove_list.extend(r_list)
+                elif future in sweep['futures']:
+                    sweep['results'][sweep['futures'][future]] = future.result()
+                    if not advance_k_sweep(sweep, patience):
+                        continue
+                    # The sweep of the service has finished, so that the rest
+                    # of its work units are cancelled.
+                    for f in sweep['futures']:
+                        if f in pending:
+                            f.cancel()
+                            pending.remove(f)
+                    sweep['futures'] = {}
+                    if sweep['best_k'] is not None:
+                        for f in submit_representative_metrics(sweep, executor):
+                            future_to_service[f] = ser
+                            representative_futures.add(f)
+                            pending.add(f)
+                else:
+                    # a k finished in the same batch as the end of the sweep
+                    # of its service, whose result is no longer needed.
+                    continue
+                service_times[ser] = round(time.time() - sweep['start'], 2)
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
 
+    reduced_df = reduced_by_cv_df.drop(remove_list, axis=1)
+    return reduced_df, clustering_info, service_times
 
-def run_tsifter(data_df, metrics_dimension, services_list, max_workers):
-    # step1
-    start = time.time()
 
-    reduced_by_st_df = tsifter_reduce_series(data_df, max_workers)
+def run_tsifter(data_df, metrics_dimension, services_list, max_workers,
+                adf_chunk_size=ADF_CHUNK_SIZE, adf_maxlag=None):
+    # worker processes are shared between step1 and step2.
+    with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # step1
+        start = time.time()
 
-    time_adf = round(time.time() - start, 2)
-    metrics_dimension = util.count_metrics(metrics_dimension, reduced_by_st_df, 1)
-    metrics_dimension["total"].append(len(reduced_by_st_df.columns))
+        reduced_by_st_df, chunk_times = tsifter_reduce_series(
+            data_df, executor, adf_chunk_size, adf_maxlag)
 
-    # step2
-    start = time.time()
+        time_adf = round(time.time() - start, 2)
+        metrics_dimension = util.count_metrics(metrics_dimension, reduced_by_st_df, 1)
+        metrics_dimension["total"].append(len(reduced_by_st_df.columns))
 
-    reduced_df, clustering_info = tsifter_clustering(
-        reduced_by_st_df, services_list, max_workers)
+        # step2
+        start = time.time()
 
-    time_clustering = round(time.time() - start, 2)
-    metrics_dimension = util.count_metrics(metrics_dimension, reduced_df, 2)
-    metrics_dimension["total"].append(len(reduced_df.columns))
+        reduced_df, clustering_info = tsifter_clustering(
+            reduced_by_st_df, services_list, executor)
+
+        time_clustering = round(time.time() - start, 2)
+        metrics_dimension = util.count_metrics(metrics_dimension, reduced_df, 2)
+        metrics_dimension["total"].append(len(reduced_df.columns))
 
-    return {'step1': time_adf, 'step2': time_clustering}, \
+    return {'step1': time_adf, 'step2': time_clustering, 'step1_chunks': chunk_times}, \
         reduced_df, metrics_dimension, clustering_info
 
 
-def run_sieve(data_df, metrics_dimension, services_list, max_workers):
+def run_sieve(data_df, metrics_dimension, services_list, max_workers, patience=None):
     # step1
     start = time.time()
 
@@ -296,40 +368,101 @@ def run_sieve(data_df, metrics_dimension, services_list, max_workers):
     # step2
     start = time.time()
 
-    reduced_df, clustering_info = sieve_clustering(
-        reduced_by_st_df, services_list, max_workers)
+    with futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        reduced_df, clustering_info, service_times = sieve_clustering(
+            reduced_by_st_df, services_list, executor, patience)
 
     time_clustering = round(time.time() - start, 2)
     metrics_dimension = util.count_metrics(metrics_dimension, reduced_df, 2)
     metrics_dimension["total"].append(len(reduced_df.columns))
 
-    return {'step1': time_cv, 'step2': time_clustering}, \
+    return {'step1': time_cv, 'step2': time_clustering, 'step2_services': service_times}, \
         reduced_df, metrics_dimension, clustering_info
 
 
-def read_metrics_json(data_file):
+def metric_column_name(target, metric):
+    """
+    Return the column name of a metric of the target, or None if the
+    metric is excluded from the analysis.
+    """
+    if metric["metric_name"] not in TARGET_DATA[target] and TARGET_DATA[target] != "all":
+        return None
+    metric_name = metric["metric_name"].replace("container_", "").replace("node_", "")
+    target_name = metric[
+        "{}_name".format(target[:-1]) if target != "middlewares" else "container_name"
+    ]
+    if target_name in ["queue-master", "rabbitmq", "session-db"]:
+        return None
+    # remove ';node-exporter' suffix of k8s node name.
+    target_name = re.sub(';node-exporter$', '', target_name)
+    return "{}-{}_{}".format(target[0], target_name, metric_name)
+
+
+def build_metrics_df(matrix, columns):
+    data_df = pd.DataFrame(matrix, columns=columns, copy=False)
+    data_df = data_df.round(4)
+    data_df = data_df.interpolate(method="spline", order=3, limit_direction="both")
+    return data_df
+
+
+def read_metrics_file(data_file, plots_num=PLOTS_NUM):
+    """ Read a metrics file in either JSON or columnar format. """
+    if columnar.is_columnar(data_file):
+        return read_metrics_columnar(data_file, plots_num)
+    return read_metrics_json(data_file, plots_num)
+
+
+def read_metrics_columnar(data_file, plots_num=PLOTS_NUM):
+    header, _, values = columnar.load(data_file)
+
+    # order the columns by target in the same way as read_metrics_json.
+    # a duplicated column overwrites the former one in place.
+    column_index = {}
+    for target in TARGET_DATA:
+        for i, metric in enumerate(header['series']):
+            if metric['kind'] != target:
+                continue
+            column_name = metric_column_name(target, metric)
+            if column_name is None:
+                continue
+            column_index[column_name] = i
+
+    # copy only the selected rows of the tail out of the memory-mapped file.
+    rows = np.fromiter(column_index.values(), dtype=np.intp, count=len(column_index))
+    matrix = values[rows, -plots_num:] if plots_num else values[rows]
+    return build_metrics_df(matrix.T, list(column_index)), header['mappings'], header['meta']
+
+
+def read_metrics_json(data_file, plots_num=PLOTS_NUM):
     with open(data_file) as f:
         raw_json = json.load(f)
-    raw_data = pd.read_json(data_file)
-    data_df = pd.DataFrame()
+
+    # Collect the target series first so that the value matrix can be
+    # allocated at once instead of growing a DataFrame column by column.
+    column_index, values_list = {}, []
     for target in TARGET_DATA:
-        for t in raw_data[target].dropna():
+        for t in (raw_json.get(target) or {}).values():
             for metric in t:
-                if metric["metric_name"] not in TARGET_DATA[target] and TARGET_DATA[target] != "all":
-                    continue
-                metric_name = metric["metric_name"].replace("container_", "").replace("node_", "")
-                target_name = metric[
-                    "{}_name".format(target[:-1]) if target != "middlewares" else "container_name"
-                ]
-                if target_name in ["queue-master", "rabbitmq", "session-db"]:
+                column_name = metric_column_name(target, metric)
+                if column_name is None:
                     continue
-                # remove ';node-exporter' suffix of k8s node name.
-                target_name = re.sub(';node-exporter$', '', target_name)
-                column_name = "{}-{}_{}".format(target[0], target_name, metric_name)
-                data_df[column_name] = np.array(metric["values"], dtype=np.float64)[:, 1][-PLOTS_NUM:]
-    data_df = data_df.round(4)
-    data_df = data_df.interpolate(method="spline", order=3, limit_direction="both")
-    return data_df, raw_json['mappings'], raw_json['meta']
+                values = metric["values"][-plots_num:] if plots_num else metric["values"]
+                # a duplicated column overwrites the former one in place.
+                if column_name in column_index:
+                    values_list[column_index[column_name]] = values
+                else:
+                    column_index[column_name] = len(values_list)
+                    values_list.append(values)
+
+    nrows = len(values_list[0]) if values_list else 0
+    matrix = np.empty((nrows, len(values_list)), dtype=np.float64)
+    for i, values in enumerate(values_list):
+        if len(values) != nrows:
+            raise ValueError("length of values ({}) does not match length of index ({})".format(
+                len(values), nrows))
+        matrix[:, i] = [v[1] for v in values]
+
+    return build_metrics_df(matrix, list(column_index)), raw_json['mappings'], raw_json['meta']
 
 
 def prepare_services_list(data_df):
@@ -354,7 +487,7 @@ def aggregate_dimension(data_df):
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("datafile", help="metrics JSON data file")
+    parser.add_argument("datafile", help="metrics data file (JSON or columnar)")
     parser.add_argument("--method",
                         help="specify one of tsdr methods",
                         type=str, default=TSIFTER_METHOD)
@@ -367,6 +500,15 @@ def main():
     parser.add_argument("--metric-num",
                         help="number of metrics (for experiment)",
                         type=int, default=None)
+    parser.add_argument("--adf-chunk-size",
+                        help="number of series sent to a worker at once in ADF tests",
+                        type=int, default=ADF_CHUNK_SIZE)
+    parser.add_argument("--adf-maxlag",
+                        help="test all series in a batch with the fixed lag length instead of selecting it by AIC",
+                        type=int, default=None)
+    parser.add_argument("--sieve-patience",
+                        help="stop the k sweep of a service when silhouette score has not been improved for this number of k",
+                        type=int, default=None)
     parser.add_argument("--out", help="output path", type=str)
     parser.add_argument("--results-dir",
                         help="output directory",
@@ -376,17 +518,19 @@ def main():
                         action='store_true')
     args = parser.parse_args()
 
-    data_df, mappings, metrics_meta = read_metrics_json(args.datafile)
+    data_df, mappings, metrics_meta = read_metrics_file(args.datafile)
     services = prepare_services_list(data_df)
 
     metrics_dimension = aggregate_dimension(data_df)
 
     if args.method == TSIFTER_METHOD:
         elapsedTime, reduced_df, metrics_dimension, clustering_info = run_tsifter(
-            data_df, metrics_dimension, services, args.max_workers)
+            data_df, metrics_dimension, services, args.max_workers,
+            args.adf_chunk_size, args.adf_maxlag)
     elif args.method == SIEVE_METHOD:
         elapsedTime, reduced_df, metrics_dimension, clustering_info = run_sieve(
-            data_df, metrics_dimension, services, args.max_workers)
+            data_df, metrics_dimension, services, args.max_workers,
+            args.sieve_patience)
     else:
         print("--method must be {} or {}",
               TSIFTER_METHOD, SIEVE_METHOD, file=sys.stderr)
@@ -407,6 +551,10 @@ def main():
         'components_mappings': mappings,
         'metrics_meta': metrics_meta,
     }
+    if 'step1_chunks' in elapsedTime:
+        summary['execution_time']['reduce_series_chunks'] = elapsedTime['step1_chunks']
+    if 'step2_services' in elapsedTime:
+        summary['execution_time']['clustering_services'] = elapsedTime['step2_services']
     if args.include_raw_data:
         summary["reduced_metrics_raw_data"] = reduced_df.to_dict()
 
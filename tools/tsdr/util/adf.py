@@ -0,0 +1,38 @@
+import numpy as np
+from statsmodels.tsa.adfvalues import mackinnonp
+
+
+def adfuller_fixed_lag(data, maxlag):
+    """
+    Augmented Dickey-Fuller test with a constant and a fixed lag length over
+    all columns of data at once.
+    It is equivalent to adfuller(x, maxlag=maxlag, autolag=None) for each
+    column x, but every regression is solved in a few batched matrix ops.
+    Returns the array of p-values.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+    nobs = data.shape[0] - 1 - maxlag
+    if maxlag < 0 or nobs <= maxlag + 2:
+        raise ValueError("maxlag is too large for the number of samples")
+
+    diff = np.diff(data, axis=0)
+    # design matrix: [x_{t-1}, dx_{t-1}, ..., dx_{t-maxlag}, const]
+    x = np.empty((data.shape[1], nobs, maxlag + 2))
+    x[:, :, 0] = data[-nobs - 1:-1].T
+    for i in range(1, maxlag + 1):
+        x[:, :, i] = diff[-nobs - i:-i].T
+    x[:, :, -1] = 1.
+    y = diff[-nobs:].T[:, :, np.newaxis]
+
+    xtx_inv = np.linalg.pinv(x.transpose(0, 2, 1) @ x)
+    beta = xtx_inv @ (x.transpose(0, 2, 1) @ y)
+    resid = (y - x @ beta)[:, :, 0]
+    sigma2 = (resid ** 2).sum(axis=1) / (nobs - x.shape[2])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        adfstat = beta[:, 0, 0] / np.sqrt(sigma2 * xtx_inv[:, 0, 0])
+    return np.array([
+        mackinnonp(stat, regression='c', N=1) if np.isfinite(stat) else np.nan
+        for stat in adfstat
+    ])
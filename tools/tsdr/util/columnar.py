@@ -0,0 +1,32 @@
+import json
+import struct
+
+import numpy as np
+
+# see tools/metrics/columnar.py for the layout of the file.
+MAGIC = b'TSDRCOL1'
+_HEADER_LEN = struct.Struct('<Q')
+
+
+def is_columnar(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def load(path):
+    """
+    Read the header of a columnar metrics file and memory-map its arrays.
+    Returns (header, timestamps, values), where values[i] is the series
+    described by header['series'][i].
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a columnar metrics file".format(path))
+        header_len, = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+        header = json.loads(f.read(header_len))
+    offset = len(MAGIC) + _HEADER_LEN.size + header_len
+    num_points, num_series = header['num_points'], len(header['series'])
+    timestamps = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(num_points,))
+    offset += timestamps.nbytes
+    values = np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=(num_series, num_points))
+    return header, timestamps, values
@@ -1,3 +1,5 @@
+from multiprocessing import shared_memory
+
 import numpy as np
 
 def z_normalization(data):
@@ -31,3 +33,34 @@ def count_metrics(metrics_dimension, dataframe, n):
                 metrics_dimension["nodes"][node_name] = [0, 0, 0]
             metrics_dimension["nodes"][node_name][n] += 1
     return metrics_dimension
+
+
+def to_shared_array(arr):
+    """
+    Copy arr into a new shared memory block.
+    Returns the block and the spec to attach it from other processes.
+    The caller is responsible for closing and unlinking the block.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+def attach_shared_array(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def run_with_shared_arrays(func, specs, *args):
+    """
+    Call func(*arrays, *args) with the arrays attached from the specs.
+    This is intended to be submitted to a process pool.
+    """
+    attached = [attach_shared_array(spec) for spec in specs]
+    try:
+        return func(*[arr for _, arr in attached], *args)
+    finally:
+        shms = [shm for shm, _ in attached]
+        # views must be released before closing the blocks.
+        del attached
+        for shm in shms:
+            shm.close()